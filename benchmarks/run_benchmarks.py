@@ -0,0 +1,155 @@
+"""Hot-path benchmarks on synthetic station sheets.
+
+    python benchmarks/run_benchmarks.py --recipes 10 100 1000 10000 --save-baseline baseline.json
+    python benchmarks/run_benchmarks.py --recipes 10 100 1000 10000 --baseline baseline.json
+
+Reports the best-of-N wall time and the tracemalloc peak of every stage. With
+--baseline, exits 1 when a stage is slower, or its peak memory higher, than
+baseline * (1 + tolerance).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from bom import (
+    BOMExplosion,
+    CostModel,
+    LaborCapacity,
+    RecipeIndex,
+    WhereUsedIndex,
+    batch_sweep,
+    calculate_ingredients_with_batches,
+    calculate_specifications,
+    extract_bom_data,
+    get_subrecipes,
+    parse_station_sheet,
+    parse_station_tables,
+    station_data_hash,
+)
+from bom.synthetic import generate_station_data
+
+STATIONS = ["Butchery", "Hot Kitchen", "Cold Kitchen", "Pastry"]
+
+def stages(station_data):
+    """(name, callable) for every measured stage, built on the same synthetic data"""
+    df = station_data[STATIONS[0]]
+    subrecipes = get_subrecipes(df)
+    middle = subrecipes[len(subrecipes) // 2]
+    indexes = {station: RecipeIndex(data) for station, data in station_data.items()}
+    bom = indexes[STATIONS[0]].boms[middle['name']]
+    explosion = BOMExplosion(indexes)
+    explosion.batch_matrix()
+    where_used = WhereUsedIndex()
+    for station, index in indexes.items():
+        where_used.update(station, index)
+    where_used.search("warm up")
+    labor = LaborCapacity(indexes)
+    cost_model = CostModel(explosion, labor, {"RM 00010": 1.0})
+    price_changes = itertools.count(2)
+    plan = pd.DataFrame({
+        "RECIPE": [name for index in indexes.values() for name in index.names][:200],
+        "BATCHES": 2.0
+    })
+
+    return [
+        ("get_subrecipes", lambda: get_subrecipes(df)),
+        ("station_data_hash", lambda: station_data_hash(df)),
+        ("parse_station_tables", lambda: parse_station_tables(df)),
+        ("parse_station_sheet", lambda: parse_station_sheet(df)),
+        ("extract_bom_data", lambda: extract_bom_data(df, middle['row'])),
+        ("RecipeIndex", lambda: RecipeIndex(df)),
+        ("StationTables.bom", lambda: indexes[STATIONS[0]].tables.bom(middle['row'])),
+        ("RecipeBoms (cached)", lambda: indexes[STATIONS[0]].boms[middle['name']]),
+        ("calculate_specifications", lambda: calculate_specifications(bom['recipe_yield'], 3, bom['final_net_output'])),
+        ("calculate_ingredients_with_batches", lambda: calculate_ingredients_with_batches(bom['ingredients'], 3)),
+        ("batch_sweep", lambda: batch_sweep(bom['recipe_yield'], bom['final_net_output'], bom['ingredients'], range(1, 101))),
+        ("BOMExplosion.batch_matrix", lambda: BOMExplosion(indexes).batch_matrix()),
+        ("BOMExplosion.explode_plan", lambda: explosion.explode_plan(plan)),
+        ("LaborCapacity.rollup", lambda: LaborCapacity(indexes).rollup(plan, {"Butchery": 960.0})),
+        ("CostModel", lambda: CostModel(explosion, labor, {"RM 00010": 1.0})),
+        ("CostModel.set_prices", lambda: cost_model.set_prices({"RM 00010": float(next(price_changes))})),
+        ("WhereUsedIndex.where_used", lambda: where_used.where_used("RM 00010", indirect=True)),
+        ("WhereUsedIndex.search", lambda: where_used.search("rm 0001")),
+    ]
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+def run(recipe_counts, num_ingredients, repeat):
+    results = {}
+    for num_recipes in recipe_counts:
+        station_data = generate_station_data(STATIONS, num_recipes, num_ingredients)
+        # Big sheets are measured fewer times so the suite stays quick
+        stage_repeat = max(1, repeat if num_recipes <= 1000 else repeat // 3)
+        for name, func in stages(station_data):
+            seconds, peak = measure(func, stage_repeat)
+            results[f"{name}[{num_recipes}]"] = {"seconds": seconds, "peak_bytes": peak}
+            print(f"{name:<36} recipes={num_recipes:<6} {seconds * 1000:10.2f} ms {peak / 1024 / 1024:9.2f} MiB")
+    return results
+
+# Peak memory allowed over the baseline regardless of tolerance, so stages allocating a few KiB don't flap
+PEAK_SLACK_BYTES = 64 * 1024
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        limit = baseline[key]["seconds"] * (1 + tolerance)
+        if result["seconds"] > limit:
+            regressions.append(f"{key}: {result['seconds'] * 1000:.2f} ms > {limit * 1000:.2f} ms")
+        if "peak_bytes" in baseline[key]:
+            peak_limit = max(baseline[key]["peak_bytes"] * (1 + tolerance), baseline[key]["peak_bytes"] + PEAK_SLACK_BYTES)
+            if result["peak_bytes"] > peak_limit:
+                regressions.append(f"{key}: peak {result['peak_bytes'] / 1024 / 1024:.2f} MiB > "
+                                   f"{peak_limit / 1024 / 1024:.2f} MiB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ingredients", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown and peak memory growth over the baseline")
+    parser.add_argument("--save-baseline", help="write these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.recipes, args.ingredients, args.repeat)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""Headless BOM explosion core: parsing, calculations and explosion of station sheets.
+
+Importing this package does not import Streamlit, gspread or google-auth.
+"""
+
+from .cache import BOM_CACHE, BomCache
+from .calculations import batch_sweep, calculate_ingredients_with_batches, calculate_specifications
+from .costing import CostModel, read_price_table
+from .explosion import BOMCycleError, BOMExplosion, read_production_plan
+from .export import export_bytes, export_datasets, iter_plan_chunks, iter_recipe_chunks, recipe_datasets
+from .governor import BACKGROUND, INTERACTIVE, SHEETS_GOVERNOR, SheetsGovernor, request_priority
+from .labor import DEPARTMENTS, LaborCapacity, parse_available_minutes
+from .parsing import (
+    INGREDIENT_COLUMNS,
+    LABOR_COLUMNS,
+    LABOR_DEPARTMENTS,
+    PACK_SIZE_OPTIONS,
+    PackSize,
+    RecipeBom,
+    RecipeBoms,
+    RecipeIndex,
+    StationData,
+    StationTables,
+    extract_bom_data,
+    find_pack_size_rows,
+    get_subrecipes,
+    parse_station_sheet,
+    parse_station_tables,
+    station_data_hash,
+)
+from .search import WhereUsedIndex
+from .sites import Site, SiteDataCache, consolidated_ingredient_totals, consolidated_recipes, load_sites
+from .sources import CsvSource, DataSource, GoogleSheetsSource, XlsxSource, open_data_source
+from .sheets import (
+    SPREADSHEET_KEY,
+    STATION_DATA_TTL,
+    STATION_SHEET_MAP,
+    STATIONS,
+    PackSizeRowError,
+    SheetsSession,
+    SnapshotStore,
+    StationDataCache,
+    fetch_stations_data,
+    load_snapshot_frame,
+)
+from .writes import PackSizeWriteQueue, is_retryable
@@ -0,0 +1,84 @@
+"""Process-wide LRU cache of parsed recipe BOMs, bounded by an estimated memory ceiling.
+
+Records are shared by every session and handed out as-is, never copied, so
+callers must treat them (and the DataFrames they hold) as read-only.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from .metrics import METRICS
+
+BOM_CACHE_MAX_MB = float(os.environ.get("BOM_CACHE_MAX_MB", "64"))
+
+# Rough per-record cost of the record, its pack sizes and the DataFrame objects
+RECORD_OVERHEAD_BYTES = 4096
+
+def record_bytes(record):
+    """Estimated bytes held by a RecipeBom: its tables' buffers plus a fixed overhead"""
+    frames = (record.ingredients, record.labor_productivity)
+    return RECORD_OVERHEAD_BYTES + int(sum(frame.memory_usage(index=False).sum() for frame in frames))
+
+class BomCache:
+    """LRU of {key: RecipeBom} that evicts the least recently used records above max_bytes"""
+
+    def __init__(self, max_bytes=BOM_CACHE_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_or_build(self, key, build):
+        """Cached record for key, else build() stored as most recently used"""
+        with self._lock:
+            cached = self._records.get(key)
+            if cached is not None:
+                self._records.move_to_end(key)
+                self._hits += 1
+        if cached is not None:
+            METRICS.inc("bom_cache_hits_total")
+            return cached[0]
+
+        record = build()
+        size = record_bytes(record)
+        evicted = 0
+        with self._lock:
+            self._misses += 1
+            if key not in self._records:
+                self._records[key] = (record, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes and len(self._records) > 1:
+                _, (_, evicted_size) = self._records.popitem(last=False)
+                self._bytes -= evicted_size
+                evicted += 1
+            self._evictions += evicted
+            record = self._records[key][0] if key in self._records else record
+        METRICS.inc("bom_cache_misses_total")
+        if evicted:
+            METRICS.inc("bom_cache_evictions_total", evicted)
+        return record
+
+    def stats(self):
+        """hits, misses, evictions, hit_rate, entries, bytes and max_bytes"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+                "entries": len(self._records),
+                "bytes": self._bytes,
+                "max_bytes": int(self.max_bytes)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._bytes = 0
+
+BOM_CACHE = BomCache()
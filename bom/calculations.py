@@ -0,0 +1,82 @@
+"""Batch scaling of specifications and ingredient quantities"""
+
+import numpy as np
+import pandas as pd
+
+from .metrics import timed
+
+SWEEP_SPECIFICATIONS = ["Recipe Yield (Unportioned)", "Theoretical Total", "Final Net Output (yielded weight)",
+                        "Processing Loss", "Processing Loss %"]
+
+@timed("calculate_specifications")
+def calculate_specifications(recipe_yield, num_batches, final_net_output):
+    """Calculate specifications where theoretical total = recipe yield * batches"""
+    try:
+        yield_val = float(recipe_yield) if recipe_yield else 0
+        batches = float(num_batches) if num_batches else 1
+        final_output = float(final_net_output) if final_net_output else 0
+        
+        # Recipe Yield (Unportioned) in app = original recipe yield * batches
+        calculated_recipe_yield = yield_val * batches
+        
+        # Theoretical Total = Recipe Yield (Unportioned) from the app
+        theoretical_total = calculated_recipe_yield
+        
+        processing_loss = theoretical_total - final_output
+        processing_loss_pct = (processing_loss / theoretical_total * 100) if theoretical_total > 0 else 0
+        
+        return calculated_recipe_yield, theoretical_total, final_output, processing_loss, processing_loss_pct
+    except:
+        return 0, 0, 0, 0, 0
+
+@timed("calculate_ingredients_with_batches")
+def calculate_ingredients_with_batches(ingredients_df, num_batches):
+    """QTY stays the same, BATCH QTY = QTY * num_batches"""
+    if ingredients_df.empty:
+        return ingredients_df
+    
+    try:
+        batches = float(num_batches) if num_batches else 1
+        updated_df = ingredients_df.copy()
+        
+        # QTY column remains unchanged
+        # BATCH QTY = QTY * number of batches (QTY is parsed as float once per data load)
+        updated_df['BATCH QTY'] = updated_df['QTY'] * batches
+        updated_df['BATCH QTY'] = updated_df['BATCH QTY'].round(3)
+        
+        # Keep original column order
+        updated_df = updated_df[['QTY', 'BATCH QTY', 'INTERNAL NAME']]
+        
+        return updated_df
+    except:
+        return ingredients_df
+
+@timed("batch_sweep")
+def batch_sweep(recipe_yield, final_net_output, ingredients_df, batch_counts):
+    """What-if table for many batch counts at once.
+
+    Same formulas as calculate_specifications and calculate_ingredients_with_batches,
+    broadcast over every batch count in one pass: one row per specification and
+    ingredient (ITEM), one column per batch count.
+    """
+    batches = np.asarray(list(batch_counts), dtype=float)
+    yield_val = float(recipe_yield) if recipe_yield else 0.0
+    final_output = float(final_net_output) if final_net_output else 0.0
+
+    theoretical_total = yield_val * batches
+    processing_loss = theoretical_total - final_output
+    safe_total = np.where(theoretical_total > 0, theoretical_total, 1.0)
+    processing_loss_pct = np.where(theoretical_total > 0, processing_loss / safe_total * 100, 0.0)
+    specs = np.vstack([theoretical_total, theoretical_total, np.full_like(batches, final_output),
+                       processing_loss, processing_loss_pct])
+
+    if ingredients_df.empty:
+        qty, names = np.empty(0), []
+    else:
+        qty, names = ingredients_df['QTY'].to_numpy(dtype=float), ingredients_df['INTERNAL NAME'].tolist()
+    batch_qty = np.outer(qty, batches)
+
+    sweep = pd.DataFrame(np.vstack([specs, batch_qty]).round(3),
+                         columns=[f"{count:g}" for count in batches])
+    sweep.insert(0, "ITEM", SWEEP_SPECIFICATIONS + names)
+    return sweep
@@ -0,0 +1,221 @@
+"""Command line entry point: python -m bom explode --station "Hot Kitchen" --recipe X --batches 4"""
+
+import argparse
+import os
+import sys
+
+from .calculations import calculate_ingredients_with_batches
+from .costing import PRICE_TABLE, CostModel, read_price_table
+from .explosion import BOMCycleError, BOMExplosion, read_production_plan
+from .export import EXPORT_FORMATS, RECIPE_DATASETS, export_datasets, iter_plan_chunks, recipe_datasets
+from .labor import LABOR_CAPACITY, LaborCapacity, parse_available_minutes
+from .parsing import RecipeIndex
+from .search import WhereUsedIndex
+from .sheets import SheetsSession, SnapshotStore, StationDataCache, credentials_from_service_account_file
+from .sites import (
+    SITES_CONFIG,
+    SiteDataCache,
+    consolidated_ingredient_totals,
+    consolidated_recipes,
+    load_sites,
+)
+from .sources import DATA_SOURCE
+
+def open_site_source(args, site):
+    session = None
+    if args.credentials:
+        session = lambda: SheetsSession(credentials_from_service_account_file(args.credentials),
+                                        site.spreadsheet_key, site.stations)
+    store = SnapshotStore(args.snapshot_path) if args.snapshot_path else None
+    return site.open_source(session=session, store=store)
+
+def selected_site(args):
+    sites = load_sites(args.sites, args.source)
+    if args.site is None:
+        return sites[0]
+    for site in sites:
+        if site.name == args.site:
+            return site
+    raise SystemExit(f"Unknown site: {args.site}")
+
+def load_recipe_indexes(args):
+    """Fetch every station of the selected site from its data source and index its recipes"""
+    site = selected_site(args)
+    station_data = open_site_source(args, site).fetch(site.station_names)
+    return {station: RecipeIndex(df) for station, df in station_data.items() if df is not None}
+
+def write_table(df, fmt, out):
+    if fmt == "csv":
+        df.to_csv(out, index=False)
+    elif fmt == "json":
+        out.write(df.to_json(orient="records", indent=2))
+        out.write("\n")
+    else:
+        out.write(df.to_string(index=False))
+        out.write("\n")
+
+def cmd_recipes(args):
+    indexes = load_recipe_indexes(args)
+    for station in [args.station] if args.station else indexes:
+        for name in indexes.get(station, RecipeIndex(None)).names:
+            print(f"{station}\t{name}")
+    return 0
+
+def cmd_explode(args):
+    indexes = load_recipe_indexes(args)
+    index = indexes.get(args.station)
+    if index is None or args.recipe not in index.boms:
+        print(f"Recipe not found: {args.station} / {args.recipe}", file=sys.stderr)
+        return 1
+
+    if args.single_level:
+        table = calculate_ingredients_with_batches(index.boms[args.recipe]['ingredients'], args.batches)
+    else:
+        try:
+            table = BOMExplosion(indexes).explode(args.recipe, args.batches)
+        except BOMCycleError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+    write_table(table, args.format, sys.stdout)
+    return 0
+
+def where_used_index(args):
+    index = WhereUsedIndex()
+    for station, recipe_index in load_recipe_indexes(args).items():
+        index.update(station, recipe_index)
+    return index
+
+def cmd_where_used(args):
+    write_table(where_used_index(args).where_used(args.ingredient, indirect=args.indirect), args.format, sys.stdout)
+    return 0
+
+def cmd_search(args):
+    write_table(where_used_index(args).search(args.query, limit=args.limit), args.format, sys.stdout)
+    return 0
+
+def cmd_capacity(args):
+    with open(args.plan, "rb") as plan_file:
+        plan_df = read_production_plan(plan_file)
+    capacity, unknown = LaborCapacity(load_recipe_indexes(args)).rollup(plan_df, parse_available_minutes(args.available))
+    if unknown:
+        print(f"Recipes not found: {', '.join(unknown)}", file=sys.stderr)
+    write_table(capacity, args.format, sys.stdout)
+    return 2 if capacity['OVER CAPACITY'].any() else 0
+
+def cmd_export(args):
+    indexes = load_recipe_indexes(args)
+    datasets = recipe_datasets(indexes, args.datasets)
+    if args.plan:
+        with open(args.plan, "rb") as plan_file:
+            plan_df = read_production_plan(plan_file)
+        datasets["plan_explosion"] = iter_plan_chunks(BOMExplosion(indexes), plan_df)
+    try:
+        for path in export_datasets(datasets, args.output, args.format):
+            print(path)
+    except BOMCycleError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    return 0
+
+def cmd_cost(args):
+    if not args.prices:
+        print("No price table: pass --prices or set BOM_PRICE_TABLE", file=sys.stderr)
+        return 1
+    with open(args.prices, "rb") as price_file:
+        prices = read_price_table(price_file)
+    indexes = load_recipe_indexes(args)
+    model = CostModel(BOMExplosion(indexes), LaborCapacity(indexes), prices)
+    try:
+        table = model.pack_costs(args.recipe) if args.recipe else model.costs()
+    except KeyError:
+        print(f"Recipe not found: {args.recipe}", file=sys.stderr)
+        return 1
+    except BOMCycleError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    write_table(table, args.format, sys.stdout)
+    return 0
+
+def cmd_consolidate(args):
+    sites = load_sites(args.sites, args.source)
+    site_cache = SiteDataCache(sites, lambda site: StationDataCache(open_site_source(args, site).fetch,
+                                                                    site.station_names))
+    site_data, problems = site_cache.load_all(timeout=None)
+    for site, problem in problems.items():
+        print(f"{site}: {problem}", file=sys.stderr)
+    site_indexes = {site: {station: station_data.index for station, station_data in data.items()}
+                    for site, data in site_data.items()}
+    view = consolidated_recipes if args.view == "recipes" else consolidated_ingredient_totals
+    try:
+        table = view(site_indexes)
+    except BOMCycleError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    write_table(table, args.format, sys.stdout)
+    return 1 if problems else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bom", description="BOM explosion for the kitchen station sheets")
+    parser.add_argument("--credentials", default=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"),
+                        help="service account JSON; without it only on-disk snapshots are used")
+    parser.add_argument("--source", default=DATA_SOURCE,
+                        help="'sheets', 'snapshot:<path>', 'xlsx:<path>' or 'csv:<directory>' (default BOM_DATA_SOURCE)")
+    parser.add_argument("--snapshot-path", default=None, help="SQLite snapshot store (default BOM_SNAPSHOT_PATH)")
+    parser.add_argument("--sites", default=SITES_CONFIG,
+                        help="JSON registry of sites (default BOM_SITES); without it --source is the only site")
+    parser.add_argument("--site", default=None, help="site to read (default the first one)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    recipes = subparsers.add_parser("recipes", help="list recipe names")
+    recipes.add_argument("--station")
+    recipes.set_defaults(func=cmd_recipes)
+
+    explode = subparsers.add_parser("explode", help="explode one recipe to raw materials")
+    explode.add_argument("--station", required=True)
+    explode.add_argument("--recipe", required=True)
+    explode.add_argument("--batches", type=float, default=1)
+    explode.add_argument("--single-level", action="store_true", help="only the recipe's own ingredients")
+    explode.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    explode.set_defaults(func=cmd_explode)
+
+    where_used = subparsers.add_parser("where-used", help="recipes on every station that use an ingredient")
+    where_used.add_argument("--ingredient", required=True)
+    where_used.add_argument("--indirect", action="store_true", help="also recipes using it through sub-recipes")
+    where_used.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    where_used.set_defaults(func=cmd_where_used)
+
+    search = subparsers.add_parser("search", help="prefix/substring/fuzzy search over recipe and ingredient names")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    search.set_defaults(func=cmd_search)
+
+    capacity = subparsers.add_parser("capacity", help="labor minutes and cost per department for a production plan")
+    capacity.add_argument("--plan", required=True, help="CSV/XLSX with RECIPE and BATCHES columns")
+    capacity.add_argument("--available", default=LABOR_CAPACITY,
+                          help="'Butchery=960,Hot Kitchen=1440' or a JSON file (default BOM_LABOR_CAPACITY); exits 2 when over")
+    capacity.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    capacity.set_defaults(func=cmd_capacity)
+
+    export = subparsers.add_parser("export", help="stream every recipe's specs, ingredients, labor and pack sizes to files")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export.add_argument("--output", required=True, help="workbook path for xlsx, otherwise a directory")
+    export.add_argument("--datasets", nargs="+", choices=RECIPE_DATASETS, default=RECIPE_DATASETS)
+    export.add_argument("--plan", help="also export the full explosion of this production plan")
+    export.set_defaults(func=cmd_export)
+
+    cost = subparsers.add_parser("cost", help="per-batch and per-unit cost of every recipe, or one recipe's pack sizes")
+    cost.add_argument("--prices", default=PRICE_TABLE, help="CSV/XLSX with INTERNAL NAME and PRICE (default BOM_PRICE_TABLE)")
+    cost.add_argument("--recipe", help="cost this recipe's pack sizes instead")
+    cost.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    cost.set_defaults(func=cmd_cost)
+
+    consolidate = subparsers.add_parser("consolidate", help="recipes or ingredient totals across every site, loaded in parallel")
+    consolidate.add_argument("--view", choices=["recipes", "ingredients"], default="recipes")
+    consolidate.add_argument("--format", choices=["csv", "json", "table"], default="table")
+    consolidate.set_defaults(func=cmd_consolidate)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,216 @@
+"""Recipe and pack-size costing against an ingredient price table, recomputed incrementally"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .calculations import calculate_specifications
+from .explosion import BOMCycleError, _recipe_key
+from .metrics import span, timed
+from .parsing import _to_number
+
+PRICE_TABLE = os.environ.get("BOM_PRICE_TABLE", "")
+
+COST_COLUMNS = ["STATION", "RECIPE", "INGREDIENT COST", "LABOR COST", "BATCH COST", "OUTPUT PER BATCH",
+                "PROCESSING LOSS %", "UNIT COST", "UNPRICED LINES"]
+
+@timed("read_price_table")
+def read_price_table(uploaded_file):
+    """Read a CSV/XLSX price list into INTERNAL NAME and PRICE (per unit of the recipe QTY) columns"""
+    uploaded_file.seek(0)
+    if uploaded_file.name.lower().endswith((".xlsx", ".xls")):
+        price_df = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        price_df = pd.read_csv(uploaded_file, dtype=str)
+
+    columns = {str(col).strip().upper(): col for col in price_df.columns}
+    name_col = next((columns[c] for c in ["INTERNAL NAME", "INGREDIENT", "ITEM"] if c in columns), price_df.columns[0])
+    price_col = next((columns[c] for c in ["PRICE", "UNIT PRICE", "COST", "PRICE PER UNIT"] if c in columns),
+                     price_df.columns[1])
+
+    price_df = pd.DataFrame({
+        "INTERNAL NAME": price_df[name_col].fillna("").astype(str).str.strip(),
+        "PRICE": _to_number(price_df[price_col].fillna("").astype(str).str.strip())
+    })
+    return price_df[(price_df['INTERNAL NAME'] != "") & price_df['PRICE'].notna()].reset_index(drop=True)
+
+def _price_items(prices):
+    """(key, price) pairs from {name: price} or a read_price_table DataFrame"""
+    if isinstance(prices, pd.DataFrame):
+        prices = dict(zip(prices['INTERNAL NAME'], prices['PRICE']))
+    return [(_recipe_key(name), float(price)) for name, price in prices.items()]
+
+class CostModel:
+    """Per-batch and per-unit cost of every recipe, kept current as prices change.
+
+    Raw-material lines cost QTY x PRICE. A sub-recipe line costs QTY x the
+    sub-recipe's unit cost, its batch cost over its output per batch (see
+    BOMExplosion.output_per_batch), so processing loss raises the cost of every
+    recipe using it. Labor is the Cost per 1 batch of the recipe's departments
+    from LaborCapacity. set_prices re-costs only the recipes that depend on a
+    changed ingredient, found through the reverse dependency graph.
+    """
+
+    @timed("CostModel")
+    def __init__(self, explosion, labor_capacity, prices=None):
+        self.explosion = explosion
+        self.ingredient_ids = {}
+        self.ingredient_names = []
+        self.used_by = {}
+        self.processing_loss_pct = {}
+        self._raw_lines = {}
+        self._sub_lines = {}
+        specs = {}
+        for key, (_, _, tables, start_row) in explosion.recipes.items():
+            if id(tables) not in specs:
+                recipes = tables.recipes
+                specs[id(tables)] = dict(zip(recipes.index, zip(recipes["recipe_yield"], recipes["final_net_output"])))
+            recipe_yield, final_net_output = specs[id(tables)][start_row]
+            *_, self.processing_loss_pct[key] = calculate_specifications(
+                None if pd.isna(recipe_yield) else recipe_yield, 1, None if pd.isna(final_net_output) else final_net_output
+            )
+
+            raw, subs = {}, {}
+            for name, qty in zip(*tables.ingredient_arrays(start_row)):
+                child = _recipe_key(name)
+                if explosion.is_subrecipe(name):
+                    subs[child] = subs.get(child, 0.0) + qty
+                else:
+                    if child not in self.ingredient_ids:
+                        self.ingredient_ids[child] = len(self.ingredient_names)
+                        self.ingredient_names.append(name)
+                    raw[self.ingredient_ids[child]] = raw.get(self.ingredient_ids[child], 0.0) + qty
+                self.used_by.setdefault(child, set()).add(key)
+            self._raw_lines[key] = (np.fromiter(raw, dtype=np.int64, count=len(raw)),
+                                    np.fromiter(raw.values(), dtype=float, count=len(raw)))
+            self._sub_lines[key] = subs
+
+        labor_cost = labor_capacity.cost.sum(axis=1)
+        self.labor_cost = {key: float(labor_cost[row]) for key, row in labor_capacity.recipe_ids.items()}
+        self.prices = np.full(len(self.ingredient_names), np.nan)
+
+        self.order, self.cycle_errors = self._dependency_order()
+        self._position = {key: i for i, key in enumerate(self.order)}
+        self.ingredient_cost = {}
+        self.unit_cost = {}
+        self.unpriced = {}
+        if prices is not None:
+            self._assign_prices(_price_items(prices))
+        with span("cost_recompute", recipes=len(self.order)):
+            for key in self.order:
+                self._cost_recipe(key)
+
+    def _dependency_order(self):
+        """Recipe keys with every sub-recipe before the recipes using it, and {key: cycle message}"""
+        order, done, cycle_errors = [], set(), {}
+        for root in self.explosion.recipes:
+            stack = [(root, iter(self._sub_lines[root]), (root,))]
+            while stack:
+                key, children, path = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    if key not in done:
+                        done.add(key)
+                        order.append(key)
+                elif child in path:
+                    loop = path[path.index(child):]
+                    cycle = [self.explosion.recipes[k][1] for k in loop + (child,)]
+                    for k in loop:
+                        cycle_errors.setdefault(k, "Sub-recipe cycle: " + " -> ".join(cycle))
+                elif child not in done:
+                    stack.append((child, iter(self._sub_lines[child]), path + (child,)))
+        # Recipes in a cycle, and everything using them, can't be costed
+        blocked = set(cycle_errors)
+        for key in order:
+            if key not in blocked and any(child in blocked for child in self._sub_lines[key]):
+                blocked.add(key)
+                cycle_errors[key] = next(cycle_errors[child] for child in self._sub_lines[key] if child in blocked)
+        return [key for key in order if key not in blocked], cycle_errors
+
+    def _assign_prices(self, items):
+        """Set prices; returns the keys of ingredients whose price changed"""
+        changed = []
+        for key, price in items:
+            ingredient_id = self.ingredient_ids.get(key)
+            if ingredient_id is None:
+                continue
+            current = self.prices[ingredient_id]
+            if not (current == price or (np.isnan(current) and np.isnan(price))):
+                self.prices[ingredient_id] = price
+                changed.append(key)
+        return changed
+
+    def _cost_recipe(self, key):
+        ids, qty = self._raw_lines[key]
+        prices = self.prices[ids]
+        priced = ~np.isnan(prices)
+        cost = float(qty[priced] @ prices[priced])
+        unpriced = int((~priced).sum())
+        for child, child_qty in self._sub_lines[key].items():
+            cost += child_qty * self.unit_cost[child]
+            unpriced += self.unpriced[child]
+        self.ingredient_cost[key] = cost
+        self.unpriced[key] = unpriced
+        output = self.explosion.output_per_batch(key)
+        batch_cost = cost + self.labor_cost.get(key, 0.0)
+        self.unit_cost[key] = batch_cost / output if output > 0 else np.nan
+
+    def set_prices(self, prices):
+        """Update prices and re-cost only the recipes depending on changed ones; returns the re-costed keys"""
+        changed = self._assign_prices(_price_items(prices))
+        affected = set()
+        frontier = list(changed)
+        while frontier:
+            for key in self.used_by.get(frontier.pop(), ()):
+                if key not in affected:
+                    affected.add(key)
+                    frontier.append(key)
+        recompute = sorted((key for key in affected if key in self._position), key=self._position.get)
+        with span("cost_recompute", recipes=len(recompute)):
+            for key in recompute:
+                self._cost_recipe(key)
+        return recompute
+
+    def price_table(self):
+        """Every raw material with its current PRICE (NaN where unpriced)"""
+        return pd.DataFrame({"INTERNAL NAME": self.ingredient_names, "PRICE": self.prices})
+
+    def recipe_cost(self, recipe_name):
+        """Cost breakdown of one recipe as a dict of COST_COLUMNS; raises BOMCycleError for a recipe in a cycle"""
+        key = _recipe_key(recipe_name)
+        if key in self.cycle_errors:
+            raise BOMCycleError(self.cycle_errors[key])
+        station, name, _, _ = self.explosion.recipes[key]
+        labor = self.labor_cost.get(key, 0.0)
+        return {
+            "STATION": station,
+            "RECIPE": name,
+            "INGREDIENT COST": round(self.ingredient_cost[key], 2),
+            "LABOR COST": round(labor, 2),
+            "BATCH COST": round(self.ingredient_cost[key] + labor, 2),
+            "OUTPUT PER BATCH": self.explosion.output_per_batch(key),
+            "PROCESSING LOSS %": round(self.processing_loss_pct[key], 1),
+            "UNIT COST": round(self.unit_cost[key], 4),
+            "UNPRICED LINES": self.unpriced[key]
+        }
+
+    def costs(self):
+        """Cost breakdown of every recipe that could be costed, by station and recipe"""
+        rows = [self.recipe_cost(self.explosion.recipes[key][1]) for key in self.order]
+        return pd.DataFrame(rows, columns=COST_COLUMNS).sort_values(["STATION", "RECIPE"], ignore_index=True)
+
+    def pack_costs(self, recipe_name):
+        """Cost of each pack size of a recipe: unit cost x grams / 1000 (output per batch in kg or L)"""
+        key = _recipe_key(recipe_name)
+        if key in self.cycle_errors:
+            raise BOMCycleError(self.cycle_errors[key])
+        _, _, tables, start_row = self.explosion.recipes[key]
+        packs = tables.lines("pack_sizes", start_row)
+        return pd.DataFrame({
+            "PACK SIZE": packs["size"].astype(object).to_numpy(),
+            "GRAMS": packs["grams"].to_numpy(),
+            "AVAILABLE": packs["available"].to_numpy(),
+            "COST": (self.unit_cost[key] * packs["grams"].astype(float).to_numpy() / 1000).round(2)
+        })
@@ -0,0 +1,183 @@
+"""Multi-level BOM explosion across stations and production plans"""
+
+import numpy as np
+import pandas as pd
+
+from .metrics import span, timed
+
+class BOMCycleError(ValueError):
+    """Raised when sub-recipes reference each other in a loop"""
+
+def _recipe_key(name):
+    return str(name).strip().upper()
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value) if value not in ("", None) else default
+    except (TypeError, ValueError):
+        return default
+
+class BOMExplosion:
+    """Multi-level BOM explosion across the recipes of every station.
+
+    Ingredients whose INTERNAL NAME matches a recipe on any station are
+    sub-recipes; they are expanded recursively, scaled by the quantity used
+    relative to the sub-recipe's output per batch, down to purchased raw
+    materials. Each recipe's per-unit raw-material vector is memoized so
+    shared sub-assemblies are exploded once.
+    """
+
+    def __init__(self, recipe_indexes):
+        self.recipes = {}
+        self._outputs = {}
+        for station, index in recipe_indexes.items():
+            recipes = index.tables.recipes
+            # Usable output of one batch: yielded weight, else the unportioned recipe yield
+            final_output = recipes["final_net_output"]
+            outputs = final_output.where(final_output.fillna(0) != 0, recipes["recipe_yield"]).fillna(0)
+            for name, (start_row, _) in index.bounds.items():
+                key = _recipe_key(name)
+                if key not in self.recipes:
+                    self.recipes[key] = (station, name, index.tables, start_row)
+                    self._outputs[key] = float(outputs.loc[start_row])
+        self._unit_vectors = {}
+        self._batch_matrix = None
+        self.cycle_errors = {}
+
+    def output_per_batch(self, key):
+        """Usable output of one batch: yielded weight, else the unportioned recipe yield"""
+        return self._outputs[key]
+
+    def is_subrecipe(self, name):
+        key = _recipe_key(name)
+        return key in self._outputs and self._outputs[key] > 0
+
+    def _batch_vector(self, key, path):
+        """Raw materials for one batch of a recipe as {ingredient: qty}"""
+        _, _, tables, start_row = self.recipes[key]
+        vector = {}
+        for name, qty in zip(*tables.ingredient_arrays(start_row)):
+            if self.is_subrecipe(name):
+                for raw_name, raw_qty in self._unit_vector(_recipe_key(name), path).items():
+                    vector[raw_name] = vector.get(raw_name, 0.0) + qty * raw_qty
+            else:
+                vector[name] = vector.get(name, 0.0) + qty
+        return vector
+
+    def _unit_vector(self, key, path=()):
+        """Raw materials per unit of a recipe's output, memoized per recipe"""
+        if key in self._unit_vectors:
+            return self._unit_vectors[key]
+        if key in path:
+            cycle = [self.recipes[k][1] for k in path[path.index(key):]] + [self.recipes[key][1]]
+            raise BOMCycleError("Sub-recipe cycle: " + " -> ".join(cycle))
+
+        output = self.output_per_batch(key)
+        batch_vector = self._batch_vector(key, path + (key,))
+        vector = {name: qty / output for name, qty in batch_vector.items()}
+        self._unit_vectors[key] = vector
+        return vector
+
+    @timed("explode")
+    def explode(self, recipe_name, num_batches=1):
+        """Raw-material totals for num_batches of a recipe, largest first"""
+        key = _recipe_key(recipe_name)
+        if key not in self.recipes:
+            return pd.DataFrame(columns=["INTERNAL NAME", "TOTAL QTY"])
+
+        batches = _to_float(num_batches, 1.0)
+        vector = self._batch_vector(key, (key,))
+        exploded = pd.DataFrame({
+            "INTERNAL NAME": list(vector),
+            "TOTAL QTY": [round(qty * batches, 3) for qty in vector.values()]
+        })
+        return exploded.sort_values("TOTAL QTY", ascending=False, ignore_index=True)
+
+    def batch_matrix(self):
+        """Sparse recipe x raw-material matrix of per-batch quantities, built once.
+
+        Returned as COO arrays (rows, cols, values) with the recipe keys and raw
+        material names they index. Recipes caught in a sub-recipe cycle are left
+        out and recorded in cycle_errors.
+        """
+        if self._batch_matrix is not None:
+            return self._batch_matrix
+
+        recipe_keys = list(self.recipes)
+        material_ids = {}
+        rows, cols, values = [], [], []
+        # Built locally and assigned once: the explosion is shared by every session
+        cycle_errors = {}
+        with span("batch_matrix", recipes=len(recipe_keys)):
+            for row, key in enumerate(recipe_keys):
+                try:
+                    vector = self._batch_vector(key, (key,))
+                except BOMCycleError as e:
+                    cycle_errors[key] = str(e)
+                    continue
+                for name, qty in vector.items():
+                    rows.append(row)
+                    cols.append(material_ids.setdefault(name, len(material_ids)))
+                    values.append(qty)
+
+        self.cycle_errors = cycle_errors
+        self._batch_matrix = {
+            "recipes": recipe_keys,
+            "recipe_ids": {key: i for i, key in enumerate(recipe_keys)},
+            "materials": np.array(list(material_ids), dtype=object),
+            "rows": np.array(rows, dtype=np.int64),
+            "cols": np.array(cols, dtype=np.int64),
+            "values": np.array(values, dtype=float)
+        }
+        return self._batch_matrix
+
+    @timed("explode_plan")
+    def explode_plan(self, plan_df):
+        """Aggregate raw-material totals for a whole production plan.
+
+        plan_df has RECIPE and BATCHES columns (see read_production_plan). Returns
+        (pick_list, unknown_recipes); the pick list is one sparse matrix-vector
+        product of the per-batch matrix with the plan's batch counts.
+        """
+        matrix = self.batch_matrix()
+        recipe_ids = plan_df['RECIPE'].map(_recipe_key).map(matrix['recipe_ids'])
+        unknown = plan_df.loc[recipe_ids.isna(), 'RECIPE'].tolist()
+
+        cyclic = [name for name in plan_df['RECIPE'] if _recipe_key(name) in self.cycle_errors]
+        if cyclic:
+            raise BOMCycleError(self.cycle_errors[_recipe_key(cyclic[0])])
+
+        known = recipe_ids.notna()
+        plan_vector = np.bincount(
+            recipe_ids[known].astype(np.int64),
+            weights=pd.to_numeric(plan_df.loc[known, 'BATCHES'], errors="coerce").fillna(0).to_numpy(dtype=float),
+            minlength=len(matrix['recipes'])
+        )
+        totals = np.bincount(matrix['cols'], weights=matrix['values'] * plan_vector[matrix['rows']],
+                             minlength=len(matrix['materials']))
+
+        used = totals != 0
+        pick_list = pd.DataFrame({
+            "INTERNAL NAME": matrix['materials'][used],
+            "TOTAL QTY": totals[used].round(3)
+        })
+        return pick_list.sort_values("INTERNAL NAME", ignore_index=True), unknown
+
+@timed("read_production_plan")
+def read_production_plan(uploaded_file):
+    """Read a CSV/XLSX production plan into RECIPE and BATCHES columns"""
+    uploaded_file.seek(0)
+    if uploaded_file.name.lower().endswith((".xlsx", ".xls")):
+        plan_df = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        plan_df = pd.read_csv(uploaded_file, dtype=str)
+
+    columns = {str(col).strip().upper(): col for col in plan_df.columns}
+    recipe_col = next((columns[c] for c in ["RECIPE", "INTERNAL NAME", "RECIPE NAME"] if c in columns), plan_df.columns[0])
+    batches_col = next((columns[c] for c in ["BATCHES", "# OF BATCHES", "NUM BATCHES"] if c in columns), plan_df.columns[1])
+
+    plan_df = pd.DataFrame({
+        "RECIPE": plan_df[recipe_col].fillna("").astype(str).str.strip(),
+        "BATCHES": pd.to_numeric(plan_df[batches_col], errors="coerce").fillna(0)
+    })
+    return plan_df[plan_df['RECIPE'] != ""].reset_index(drop=True)
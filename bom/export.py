@@ -0,0 +1,203 @@
+"""Streaming bulk export of parsed recipes and plan explosions to CSV, Parquet or XLSX.
+
+Datasets are produced as DataFrame chunks of at most EXPORT_CHUNK_RECIPES recipes
+(or plan lines) and written one chunk at a time, so memory stays flat however
+many recipes the stations hold.
+"""
+
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .explosion import BOMCycleError, _recipe_key
+from .metrics import span, timed
+from .parsing import INGREDIENT_COLUMNS, LABOR_COLUMNS
+
+EXPORT_CHUNK_RECIPES = int(os.environ.get("BOM_EXPORT_CHUNK_RECIPES", "500"))
+
+EXPORT_FORMATS = ["csv", "parquet", "xlsx"]
+
+DATASET_COLUMNS = {
+    "specs": ["STATION", "RECIPE", "SKU CODE", "STANDARD BATCH SIZE", "UOM",
+              "RECIPE YIELD", "RECIPE BATCHES", "FINAL NET OUTPUT"],
+    "ingredients": ["STATION", "RECIPE"] + INGREDIENT_COLUMNS,
+    "labor": ["STATION", "RECIPE"] + LABOR_COLUMNS,
+    "pack_sizes": ["STATION", "RECIPE", "PACK SIZE", "GRAMS", "AVAILABLE"],
+    "plan_explosion": ["RECIPE", "BATCHES", "INTERNAL NAME", "TOTAL QTY"]
+}
+
+RECIPE_DATASETS = ["specs", "ingredients", "labor", "pack_sizes"]
+
+def _specs_chunk(tables, first_row, last_row):
+    recipes = tables.recipes.loc[first_row:last_row]
+    specs = tables.lines_between("specs", first_row, last_row).drop_duplicates("section").set_index("section")
+    return pd.DataFrame({
+        "section": recipes.index,
+        "SKU CODE": recipes["sku_code"].to_numpy(),
+        "STANDARD BATCH SIZE": specs["Value"].reindex(recipes.index).to_numpy(),
+        "UOM": specs["UOM"].reindex(recipes.index).to_numpy(),
+        "RECIPE YIELD": recipes["recipe_yield"].to_numpy(),
+        "RECIPE BATCHES": recipes["recipe_batches"].to_numpy(),
+        "FINAL NET OUTPUT": recipes["final_net_output"].to_numpy()
+    })
+
+def _pack_sizes_chunk(tables, first_row, last_row):
+    packs = tables.lines_between("pack_sizes", first_row, last_row)
+    return pd.DataFrame({
+        "section": packs["section"].to_numpy(),
+        "PACK SIZE": packs["size"].to_numpy(),
+        "GRAMS": packs["grams"].to_numpy(),
+        "AVAILABLE": packs["available"].to_numpy()
+    })
+
+_CHUNK_BUILDERS = {
+    "specs": _specs_chunk,
+    "ingredients": lambda tables, first_row, last_row: tables.lines_between("ingredients", first_row, last_row),
+    "labor": lambda tables, first_row, last_row: tables.lines_between("labor", first_row, last_row),
+    "pack_sizes": _pack_sizes_chunk
+}
+
+def _plain_dtypes(chunk):
+    """Categoricals as plain strings, so every chunk of a dataset has the same schema"""
+    categorical = [col for col, dtype in chunk.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    return chunk.astype({col: object for col in categorical}) if categorical else chunk
+
+def iter_recipe_chunks(recipe_indexes, dataset, chunk_recipes=EXPORT_CHUNK_RECIPES):
+    """Chunks of one recipe dataset (specs, ingredients, labor or pack_sizes) over every station"""
+    build = _CHUNK_BUILDERS[dataset]
+    for station, index in recipe_indexes.items():
+        start_rows = index.tables.recipes.index
+        for lo in range(0, len(start_rows), chunk_recipes):
+            first_row, last_row = start_rows[lo], start_rows[min(lo + chunk_recipes, len(start_rows)) - 1]
+            chunk = build(index.tables, first_row, last_row)
+            recipes = chunk["section"].map(index.section_names)
+            chunk = chunk.drop(columns="section").assign(STATION=station, RECIPE=recipes.to_numpy())
+            chunk = chunk[recipes.notna().to_numpy()]
+            if len(chunk):
+                yield _plain_dtypes(chunk[DATASET_COLUMNS[dataset]])
+
+def iter_plan_chunks(explosion, plan_df, chunk_rows=EXPORT_CHUNK_RECIPES):
+    """Raw-material lines of every plan line: RECIPE, BATCHES, INTERNAL NAME, TOTAL QTY.
+
+    Unknown recipes are skipped; a plan recipe caught in a sub-recipe cycle raises
+    BOMCycleError like explode_plan.
+    """
+    matrix = explosion.batch_matrix()
+    # The matrix is built recipe by recipe, so each recipe's entries are one slice
+    row_starts = np.searchsorted(matrix['rows'], np.arange(len(matrix['recipes']) + 1))
+    recipe_ids = plan_df['RECIPE'].map(_recipe_key).map(matrix['recipe_ids'])
+    batches = pd.to_numeric(plan_df['BATCHES'], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+    for lo in range(0, len(plan_df), chunk_rows):
+        positions, plan_lines = [], []
+        for line in range(lo, min(lo + chunk_rows, len(plan_df))):
+            recipe = plan_df['RECIPE'].iat[line]
+            if _recipe_key(recipe) in explosion.cycle_errors:
+                raise BOMCycleError(explosion.cycle_errors[_recipe_key(recipe)])
+            if pd.isna(recipe_ids.iat[line]):
+                continue
+            recipe_id = int(recipe_ids.iat[line])
+            entries = np.arange(row_starts[recipe_id], row_starts[recipe_id + 1])
+            positions.append(entries)
+            plan_lines.append(np.full(len(entries), line))
+        if not positions:
+            continue
+        positions, plan_lines = np.concatenate(positions), np.concatenate(plan_lines)
+        yield pd.DataFrame({
+            "RECIPE": plan_df['RECIPE'].to_numpy()[plan_lines],
+            "BATCHES": batches[plan_lines],
+            "INTERNAL NAME": matrix['materials'][matrix['cols'][positions]],
+            "TOTAL QTY": (matrix['values'][positions] * batches[plan_lines]).round(3)
+        })
+
+def _write_csv(chunks, path, columns):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        pd.DataFrame(columns=columns).to_csv(f, index=False)
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=False)
+
+def _write_parquet(chunks, path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            pq.write_table(pa.Table.from_pandas(pd.DataFrame(columns=columns), preserve_index=False), path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def _write_xlsx(datasets, path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, (chunks, columns) in datasets.items():
+        worksheet = workbook.create_sheet(title=name[:31])
+        worksheet.append(columns)
+        for chunk in chunks:
+            # Empty cells for NaN/NA, which openpyxl can't write
+            cells = chunk.astype(object).where(chunk.notna().to_numpy(), None)
+            for row in cells.itertuples(index=False, name=None):
+                worksheet.append(row)
+    workbook.save(path)
+
+@timed("export")
+def export_datasets(datasets, output, fmt):
+    """Stream {name: chunk iterator} to output and return the written paths.
+
+    xlsx writes one worksheet per dataset into the workbook at output; csv and
+    parquet write '<name>.<fmt>' into the output directory.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    datasets = {name: (chunks, DATASET_COLUMNS[name]) for name, chunks in datasets.items()}
+    if fmt == "xlsx":
+        with span("export_xlsx", datasets=len(datasets)):
+            _write_xlsx(datasets, output)
+        return [output]
+
+    os.makedirs(output, exist_ok=True)
+    write = _write_csv if fmt == "csv" else _write_parquet
+    paths = []
+    for name, (chunks, columns) in datasets.items():
+        path = os.path.join(output, f"{name}.{fmt}")
+        with span(f"export_{fmt}", dataset=name):
+            write(chunks, path, columns)
+        paths.append(path)
+    return paths
+
+def recipe_datasets(recipe_indexes, names=RECIPE_DATASETS, chunk_recipes=EXPORT_CHUNK_RECIPES):
+    """{name: chunk iterator} of the parsed recipe datasets, for export_datasets"""
+    return {name: iter_recipe_chunks(recipe_indexes, name, chunk_recipes) for name in names}
+
+def export_file_name(names, fmt):
+    """Download name of export_bytes output for these dataset names"""
+    if fmt == "xlsx":
+        return "bom_export.xlsx"
+    return f"{names[0]}.{fmt}" if len(names) == 1 else "bom_export.zip"
+
+def export_bytes(datasets, fmt):
+    """Export as one download: the workbook, the single dataset file, or a zip of the files"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "bom_export.xlsx") if fmt == "xlsx" else tmp_dir
+        paths = export_datasets(datasets, output, fmt)
+        if len(paths) == 1:
+            with open(paths[0], "rb") as f:
+                return f.read()
+
+        archive = os.path.join(tmp_dir, "bom_export.zip")
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for path in paths:
+                zf.write(path, os.path.basename(path))
+        with open(archive, "rb") as f:
+            return f.read()
@@ -0,0 +1,182 @@
+"""Process-wide governor for Google Sheets API calls.
+
+Identical reads already in flight are shared instead of repeated (single-flight),
+and every request spends a token from a per-minute budget matching the Sheets
+quota. When the budget runs out, interactive requests are served before
+background refreshes.
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import METRICS, _sheets_api_name, span
+
+SHEETS_READS_PER_MINUTE = float(os.environ.get("BOM_SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = float(os.environ.get("BOM_SHEETS_WRITES_PER_MINUTE", "60"))
+# Requests that may go out back to back before the per-minute rate applies
+SHEETS_BURST = float(os.environ.get("BOM_SHEETS_BURST", "10"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_local = threading.local()
+
+def current_priority():
+    return getattr(_local, "priority", INTERACTIVE)
+
+@contextmanager
+def request_priority(priority):
+    """Run this thread's Sheets requests at priority (INTERACTIVE or BACKGROUND)"""
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+class _Waiter:
+    def __init__(self, priority, seq):
+        self.priority = priority
+        self.seq = seq
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiter = None
+        self.result = None
+        self.error = None
+
+class TokenBucket:
+    """Token bucket refilled at per_minute / 60 tokens a second, holding at most burst.
+
+    Waiters are granted tokens in priority order, then first come first served.
+    """
+
+    def __init__(self, name, per_minute, burst=SHEETS_BURST):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, priority=INTERACTIVE, waiter=None):
+        """Take one token, waiting behind higher-priority and earlier requests; True if it had to wait"""
+        waiter = waiter or _Waiter(priority, 0)
+        with self._cond:
+            waiter.seq = next(self._seq)
+            self._waiters.append(waiter)
+            throttled = False
+            while True:
+                self._refill()
+                head = min(self._waiters, key=lambda w: (w.priority, w.seq))
+                if head is waiter and self.tokens >= 1:
+                    self.tokens -= 1
+                    self._waiters.remove(waiter)
+                    self._cond.notify_all()
+                    return throttled
+                throttled = True
+                self._cond.wait((1 - self.tokens) / self.rate if head is waiter else None)
+
+    def promote(self, waiter, priority):
+        """Raise a queued waiter to priority, e.g. when an interactive read joins a background one"""
+        with self._cond:
+            if priority < waiter.priority:
+                waiter.priority = priority
+                self._cond.notify_all()
+
+class SheetsGovernor:
+    """Single-flight deduplication and token-bucket throttling of Sheets requests"""
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE,
+                 writes_per_minute=SHEETS_WRITES_PER_MINUTE, burst=SHEETS_BURST):
+        self.buckets = {
+            "read": TokenBucket("read", reads_per_minute, burst),
+            "write": TokenBucket("write", writes_per_minute, burst)
+        }
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def call(self, func, bucket="read", key=None, api=""):
+        """Run func once a token of bucket is free (at once if bucket is None).
+
+        A call with the key of one already in flight waits for and shares its
+        result or error instead of issuing its own request.
+        """
+        priority = current_priority()
+        if key is not None:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    flight.waiter = _Waiter(priority, 0)
+            if not leader:
+                METRICS.inc("sheets_deduplicated_total", api=api)
+                if bucket is not None:
+                    self.buckets[bucket].promote(flight.waiter, priority)
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+        else:
+            flight = _Flight()
+            flight.waiter = _Waiter(priority, 0)
+
+        try:
+            if bucket is not None:
+                with span("sheets_throttle_wait", bucket=bucket, priority=PRIORITY_NAMES[priority]):
+                    throttled = self.buckets[bucket].acquire(priority, flight.waiter)
+                if throttled:
+                    METRICS.inc("sheets_throttled_total", bucket=bucket, priority=PRIORITY_NAMES[priority])
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            if key is not None:
+                with self._lock:
+                    self._flights.pop(key, None)
+            flight.done.set()
+
+SHEETS_GOVERNOR = SheetsGovernor()
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def govern_http_client(http_client, governor=SHEETS_GOVERNOR):
+    """Route every request of a gspread HTTPClient through the governor.
+
+    GET requests are reads and are deduplicated on endpoint and parameters; any
+    other method spends a write token. Drive metadata reads are deduplicated but
+    not throttled, as they count against the Drive quota instead.
+    """
+    request = http_client.request
+
+    def governed_request(method, endpoint, *args, **kwargs):
+        api = _sheets_api_name(endpoint)
+        if method.upper() != "GET":
+            return governor.call(lambda: request(method, endpoint, *args, **kwargs), "write", api=api)
+        key = (endpoint, _freeze(args), _freeze(kwargs))
+        bucket = None if api == "drive.files" else "read"
+        return governor.call(lambda: request(method, endpoint, *args, **kwargs), bucket, key, api)
+
+    http_client.request = governed_request
+    return http_client
@@ -0,0 +1,107 @@
+"""Labor capacity roll-up of a production plan per department"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .explosion import _recipe_key
+from .metrics import span, timed
+from .parsing import LABOR_COLUMNS, LABOR_DEPARTMENTS
+
+DEPARTMENTS = [department for department in LABOR_DEPARTMENTS if department != "TOTAL"]
+
+LABOR_CAPACITY = os.environ.get("BOM_LABOR_CAPACITY", "")
+
+def parse_available_minutes(spec=LABOR_CAPACITY):
+    """{department: available staff-minutes} from 'Butchery=960,Hot Kitchen=1440' or a JSON file"""
+    if not spec:
+        return {}
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            configured = json.load(f)
+    else:
+        configured = dict(item.split("=", 1) for item in spec.split(",") if "=" in item)
+
+    available = {}
+    for department, minutes in configured.items():
+        department = department.strip()
+        if department not in DEPARTMENTS:
+            raise ValueError(f"Unknown department: {department}")
+        available[department] = float(minutes)
+    return available
+
+class LaborCapacity:
+    """Recipe x department matrices of labor minutes and cost per batch, built once.
+
+    Minutes are the Batch Production column of each recipe's LABOR PRODUCTIVITY
+    block and cost the Cost per 1 batch column; the sheet's TOTAL row is left out
+    and recomputed. A recipe name found on several stations takes its labor from
+    the first.
+    """
+
+    @timed("LaborCapacity")
+    def __init__(self, recipe_indexes):
+        self.recipe_ids = {}
+        rows, cols, minutes, cost = [], [], [], []
+        for index in recipe_indexes.values():
+            section_rows = {}
+            for name, (start_row, _) in index.bounds.items():
+                key = _recipe_key(name)
+                if key not in self.recipe_ids:
+                    self.recipe_ids[key] = section_rows[start_row] = len(self.recipe_ids)
+
+            labor = index.tables.labor
+            recipe_rows = labor["section"].map(section_rows)
+            departments = labor[LABOR_COLUMNS[0]].cat.codes
+            keep = (recipe_rows.notna() & (departments >= 0) & (departments < len(DEPARTMENTS))).to_numpy()
+            rows.append(recipe_rows.to_numpy()[keep].astype(np.int64))
+            cols.append(departments.to_numpy()[keep].astype(np.int64))
+            minutes.append(labor[LABOR_COLUMNS[2]].fillna(0).to_numpy()[keep])
+            cost.append(labor[LABOR_COLUMNS[3]].fillna(0).to_numpy()[keep])
+
+        shape = (len(self.recipe_ids), len(DEPARTMENTS))
+        self.minutes = np.zeros(shape)
+        self.cost = np.zeros(shape)
+        if rows:
+            coords = (np.concatenate(rows), np.concatenate(cols))
+            np.add.at(self.minutes, coords, np.concatenate(minutes))
+            np.add.at(self.cost, coords, np.concatenate(cost))
+
+    def rollup(self, plan_df, available_minutes=None):
+        """Total minutes and cost per department for a plan, against available staff-minutes.
+
+        plan_df has RECIPE and BATCHES columns (see read_production_plan). Returns
+        (capacity, unknown_recipes): one row per department plus TOTAL, with
+        OVER CAPACITY set where planned minutes exceed the configured availability.
+        """
+        with span("labor_rollup", recipes=len(plan_df)):
+            recipe_ids = plan_df['RECIPE'].map(_recipe_key).map(self.recipe_ids)
+            unknown = plan_df.loc[recipe_ids.isna(), 'RECIPE'].tolist()
+
+            known = recipe_ids.notna()
+            plan_vector = np.bincount(
+                recipe_ids[known].astype(np.int64),
+                weights=pd.to_numeric(plan_df.loc[known, 'BATCHES'], errors="coerce").fillna(0).to_numpy(dtype=float),
+                minlength=len(self.recipe_ids)
+            )
+            minutes = np.append(plan_vector @ self.minutes, 0.0)
+            cost = np.append(plan_vector @ self.cost, 0.0)
+            minutes[-1], cost[-1] = minutes.sum(), cost.sum()
+
+            available = pd.Series(available_minutes or {}, dtype=float).reindex(DEPARTMENTS)
+            # TOTAL is only comparable once every department has an availability
+            available = np.append(available.to_numpy(), available.sum(min_count=len(DEPARTMENTS)))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                utilization = np.where(available > 0, minutes / available * 100, np.nan)
+
+        capacity = pd.DataFrame({
+            "DEPARTMENT": DEPARTMENTS + ["TOTAL"],
+            "MINUTES": minutes.round(1),
+            "COST": cost.round(2),
+            "AVAILABLE MINUTES": available,
+            "UTILIZATION %": utilization.round(1),
+            "OVER CAPACITY": minutes > np.nan_to_num(available, nan=np.inf)
+        })
+        return capacity, unknown
@@ -0,0 +1,199 @@
+"""Hot-path instrumentation: timing spans, Sheets request counters and their exports.
+
+Spans are aggregated process-wide (count, total and max seconds per name and
+labels), appended to the current thread's trace when one is active, and
+logged as one JSON object per span on the "bom.metrics" logger.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("bom.metrics")
+
+class Metrics:
+    """Thread-safe span aggregates and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+
+    def observe(self, name, seconds, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, maximum = self._spans.get(key, (0, 0.0, 0.0))
+            self._spans[key] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def span_summary(self):
+        """One row per span name and labels: count, total_ms, mean_ms, max_ms"""
+        with self._lock:
+            spans = dict(self._spans)
+        return [
+            {"span": name, **dict(labels), "count": count, "total_ms": round(total * 1000, 3),
+             "mean_ms": round(total / count * 1000, 3), "max_ms": round(maximum * 1000, 3)}
+            for (name, labels), (count, total, maximum) in sorted(spans.items())
+        ]
+
+    def counters(self):
+        with self._lock:
+            return [{"counter": name, **dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())]
+
+    def to_prometheus(self):
+        """Prometheus text exposition of every span and counter"""
+        with self._lock:
+            spans = dict(self._spans)
+            counters = dict(self._counters)
+
+        def label_text(name, labels):
+            pairs = [("span", name)] if name is not None else []
+            pairs += list(labels)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        lines = [
+            "# HELP bom_span_seconds Time spent in instrumented spans.",
+            "# TYPE bom_span_seconds summary"
+        ]
+        for (name, labels), (count, total, _) in sorted(spans.items()):
+            lines.append(f"bom_span_seconds_count{label_text(name, labels)} {count}")
+            lines.append(f"bom_span_seconds_sum{label_text(name, labels)} {total:.6f}")
+        lines += ["# HELP bom_span_seconds_max Slowest observation of each span.",
+                  "# TYPE bom_span_seconds_max gauge"]
+        for (name, labels), (_, _, maximum) in sorted(spans.items()):
+            lines.append(f"bom_span_seconds_max{label_text(name, labels)} {maximum:.6f}")
+        for counter in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE bom_{counter} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == counter:
+                    lines.append(f"bom_{name}{label_text(None, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+METRICS = Metrics()
+
+_local = threading.local()
+
+def observe_span(name, seconds, **labels):
+    METRICS.observe(name, seconds, labels)
+    record = {"span": name, "ms": round(seconds * 1000, 3), **labels}
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.append(record)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record))
+
+@contextmanager
+def span(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - started, **labels)
+
+def timed(name):
+    """Decorator form of span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def start_trace():
+    """Collect this thread's spans (e.g. one script rerun) until stop_trace"""
+    _local.trace = []
+    return _local.trace
+
+def stop_trace():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace or []
+
+def _sheets_api_name(endpoint):
+    """Short API name for a Sheets/Drive endpoint, e.g. 'values:batchGet' or 'drive.files'"""
+    if "/drive/" in endpoint:
+        return "drive.files"
+    path = endpoint.split("?")[0].split("/spreadsheets/", 1)[-1]
+    spreadsheet, _, rest = path.partition("/")
+    if not rest:
+        return "spreadsheets" + (":" + spreadsheet.split(":", 1)[1] if ":" in spreadsheet else ".get")
+    return rest.split("/")[0]
+
+def instrument_http_client(http_client):
+    """Time every request of a gspread HTTPClient and count requests and response bytes"""
+    request = http_client.request
+
+    def instrumented_request(method, endpoint, *args, **kwargs):
+        api = _sheets_api_name(endpoint)
+        status = "error"
+        try:
+            with span("sheets_request", method=method.upper(), api=api):
+                response = request(method, endpoint, *args, **kwargs)
+            status = str(response.status_code)
+            METRICS.inc("sheets_response_bytes_total", len(response.content), api=api)
+            return response
+        finally:
+            METRICS.inc("sheets_requests_total", api=api, status=status)
+
+    http_client.request = instrumented_request
+    return http_client
+
+def enable_json_logs(stream=None):
+    """Emit one JSON line per span on stream (stderr by default)"""
+    if any(getattr(handler, "_bom_json", False) for handler in logger.handlers):
+        return
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._bom_json = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def write_prometheus(path):
+    """Dump the Prometheus text to path atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(METRICS.to_prometheus())
+    os.replace(tmp_path, path)
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve GET /metrics in Prometheus text format on a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="bom-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,408 @@
+"""Station sheet parsing: recipe sections, specs, ingredients, labor and pack sizes"""
+
+import copy
+import hashlib
+import itertools
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .cache import BOM_CACHE
+from .metrics import timed
+
+LABOR_DEPARTMENTS = ["Dry Product Scaling", "Vegetable Production", "Butchery",
+                     "Cold Kitchen", "Hot Kitchen", "Pastry Kitchen", "Packaging", "TOTAL"]
+
+PACK_SIZE_OPTIONS = ["500g", "1000g", "2000g", "5000g"]
+
+INGREDIENT_COLUMNS = ["QTY", "BATCH QTY", "INTERNAL NAME"]
+
+LABOR_COLUMNS = ["LABOR PRODUCTIVITY (minutes)", "Procedure Notes", "Batch Production", "Cost per 1 batch"]
+
+def _clean_column(df, col):
+    """Column as stripped strings, '' for missing cells or columns"""
+    if col >= df.shape[1]:
+        return pd.Series("", index=df.index, dtype=object)
+    return df.iloc[:, col].fillna("").astype(str).str.strip()
+
+def _pack_row_mask(col_a, col_b, col_c):
+    """Pack size rows: a TRUE/FALSE flag in column B and the size in column C"""
+    is_flag = col_b.isin(["TRUE", "FALSE"])
+    return is_flag & (col_c != "") & ((col_a == "Pack Size") | ((col_a == "") & col_c.isin(PACK_SIZE_OPTIONS)))
+
+def _marker_mask(df):
+    """Rows whose column A holds an INTERNAL NAME recipe marker"""
+    return _clean_column(df, 0).str.upper().str.contains("INTERNAL NAME", regex=False)
+
+@timed("get_subrecipes")
+def get_subrecipes(df):
+    marker_rows = df.index[_marker_mask(df)]
+    names = _clean_column(df, 1)[marker_rows]
+    raw = df.iloc[:, 1][marker_rows]
+    return [
+        {'name': name if pd.notna(cell) else f"Recipe_{idx}", 'row': idx}
+        for idx, name, cell in zip(marker_rows, names, raw)
+    ]
+
+@timed("station_data_hash")
+def station_data_hash(df):
+    """Content hash of a loaded station sheet, used to key the recipe index cache"""
+    row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes() + str(df.shape).encode()).hexdigest()
+
+class _Record:
+    """Item access by field name, so records read like the bom_data dicts they replace"""
+
+    __slots__ = ()
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+@dataclass(frozen=True, slots=True)
+class PackSize(_Record):
+    size: str
+    grams: int | None
+    available: bool
+
+@dataclass(frozen=True, slots=True)
+class RecipeBom(_Record):
+    """bom_data of one recipe: an immutable record shared by every session.
+
+    base_specs holds (SPECIFICATIONS, Value, UOM) tuples and pack_sizes PackSize
+    records; the ingredients and labor_productivity DataFrames are shared too
+    and must not be modified in place.
+    """
+    internal_name: str
+    sku_code: str
+    base_specs: tuple
+    recipe_yield: float | None
+    recipe_batches: float | None
+    final_net_output: float | None
+    ingredients: pd.DataFrame
+    labor_productivity: pd.DataFrame
+    pack_sizes: tuple
+
+class StationTables:
+    """Typed, columnar parse of one station sheet, shared by all of its recipes.
+
+    recipes has one row per INTERNAL NAME marker (indexed by its row label) with
+    float yields; specs, ingredients, labor and pack_sizes have one row per line,
+    in sheet order, tagged with the section (marker row label) it belongs to.
+    Quantities are floats, ingredient and department names categoricals and pack
+    sizes small ints, so numbers are converted once per data load, not per rerun.
+    """
+
+    LINE_TABLES = ("specs", "ingredients", "labor", "pack_sizes")
+
+    def __init__(self, recipes, specs, ingredients, labor, pack_sizes):
+        self.recipes = recipes
+        self.specs = specs
+        self.ingredients = ingredients
+        self.labor = labor
+        self.pack_sizes = pack_sizes
+        self._sections = {table: getattr(self, table)["section"].to_numpy() for table in self.LINE_TABLES}
+        self._sections["recipes"] = recipes.index.to_numpy()
+        self._ingredient_names = ingredients["INTERNAL NAME"].cat.categories.to_numpy(dtype=object)
+        self._ingredient_codes = ingredients["INTERNAL NAME"].cat.codes.to_numpy()
+        self._ingredient_qty = ingredients["QTY"].to_numpy()
+        self._arrays = {}
+
+    def _span(self, table, start_row):
+        sections = self._sections[table]
+        return sections.searchsorted(start_row, "left"), sections.searchsorted(start_row, "right")
+
+    def lines(self, table, start_row):
+        """One recipe's rows of a line table, without the section column"""
+        lo, hi = self._span(table, start_row)
+        return getattr(self, table).iloc[lo:hi, 1:].reset_index(drop=True)
+
+    def lines_between(self, table, first_row, last_row):
+        """Rows of a line table for the recipes whose markers lie in [first_row, last_row]"""
+        sections = self._sections[table]
+        lo, hi = sections.searchsorted(first_row, "left"), sections.searchsorted(last_row, "right")
+        return getattr(self, table).iloc[lo:hi]
+
+    def ingredient_arrays(self, start_row):
+        """(names, qty) numpy arrays of one recipe's ingredient lines"""
+        lo, hi = self._span("ingredients", start_row)
+        return self._ingredient_names[self._ingredient_codes[lo:hi]], self._ingredient_qty[lo:hi]
+
+    def _columns(self, table, start_row, columns):
+        """One recipe's values of a few columns of a line table, as numpy slices"""
+        lo, hi = self._span(table, start_row)
+        arrays = self._arrays.get(table)
+        if arrays is None:
+            frame = getattr(self, table)
+            arrays = self._arrays[table] = {column: frame[column].to_numpy(dtype=object) for column in frame}
+        return [arrays[column][lo:hi] for column in columns]
+
+    def bom(self, start_row):
+        """bom_data of the recipe whose marker is start_row"""
+        internal_name, sku_code, recipe_yield, recipe_batches, final_net_output = (
+            values[0] for values in self._columns("recipes", start_row, self.recipes.columns)
+        )
+        specs = self._columns("specs", start_row, ["SPECIFICATIONS", "Value", "UOM"])
+        sizes, grams, available = self._columns("pack_sizes", start_row, ["size", "grams", "available"])
+        return RecipeBom(
+            internal_name=internal_name,
+            sku_code=sku_code,
+            base_specs=tuple(zip(*specs)),
+            recipe_yield=_optional_float(recipe_yield),
+            recipe_batches=_optional_float(recipe_batches),
+            final_net_output=_optional_float(final_net_output),
+            ingredients=self.lines("ingredients", start_row),
+            labor_productivity=self.lines("labor", start_row),
+            pack_sizes=tuple(
+                PackSize(size, None if pd.isna(size_grams) else int(size_grams), bool(flag))
+                for size, size_grams, flag in zip(sizes, grams, available)
+            )
+        )
+
+    def pack_rows(self, start_row):
+        """{pack size: sheet row label} of one recipe, as find_pack_size_rows on the loaded sheet"""
+        rows, sizes = self._columns("pack_sizes", start_row, ["row", "size"])
+        pack_rows = {}
+        for row, size in zip(rows, sizes):
+            pack_rows.setdefault(size, int(row))
+        return pack_rows
+
+    def with_pack_sizes(self, flags):
+        """Copy with {row label: available} applied to the pack sizes, sharing every other table"""
+        pack_sizes = self.pack_sizes.copy()
+        patched = pack_sizes["row"].isin(list(flags))
+        pack_sizes.loc[patched, "available"] = pack_sizes.loc[patched, "row"].map(flags).astype(bool)
+        return StationTables(self.recipes, self.specs, self.ingredients, self.labor, pack_sizes)
+
+    def memory_usage(self):
+        """Bytes held by the tables, including string categories"""
+        tables = [self.recipes] + [getattr(self, table) for table in self.LINE_TABLES]
+        return int(sum(table.memory_usage(deep=True).sum() for table in tables))
+
+class RecipeBoms(Mapping):
+    """Read-only {recipe name: RecipeBom} view, each bom sliced from the tables once and kept in BOM_CACHE"""
+
+    def __init__(self, tables, bounds, content_key, cache=BOM_CACHE):
+        self._tables = tables
+        self._bounds = bounds
+        self._content_key = content_key
+        self._cache = cache
+
+    def __getitem__(self, name):
+        start_row = self._bounds[name][0]
+        return self._cache.get_or_build((self._content_key, start_row), lambda: self._tables.bom(start_row))
+
+    def __iter__(self):
+        return iter(self._bounds)
+
+    def __len__(self):
+        return len(self._bounds)
+
+_unhashed_indexes = itertools.count()
+
+class RecipeIndex:
+    """Recipe sections of one station sheet, parsed once per data load.
+
+    tables holds the typed StationTables of the whole sheet. bounds maps recipe
+    name -> (start_row, end_row) where end_row is the next INTERNAL NAME marker
+    (or the end of the sheet); boms maps name -> RecipeBom. Duplicate names
+    resolve to their first occurrence, so section_names, start_row -> name, has
+    no entry for their later sections. Boms are cached under content_hash (see
+    station_data_hash), so indexes of the same data share them; without one
+    they are cached for this index only.
+    """
+
+    @timed("RecipeIndex")
+    def __init__(self, df, content_hash=None):
+        self.bounds = {}
+        self.section_names = {}
+        self.tables = parse_station_tables(df)
+        self.content_key = content_hash if content_hash is not None else ("unhashed", next(_unhashed_indexes))
+        self.boms = RecipeBoms(self.tables, self.bounds, self.content_key)
+        if df is None or df.empty:
+            return
+
+        subrecipes = get_subrecipes(df)
+        ends = [r['row'] for r in subrecipes[1:]] + [df.index[-1] + 1]
+        for recipe, end_row in zip(subrecipes, ends):
+            self.bounds.setdefault(recipe['name'], (recipe['row'], end_row))
+        self.section_names = {start_row: name for name, (start_row, _) in self.bounds.items()}
+
+    @property
+    def names(self):
+        return list(self.bounds)
+
+    def with_pack_sizes(self, flags, content_hash):
+        """Copy whose tables have {row label: available} applied to the pack sizes, cached under content_hash"""
+        index = copy.copy(self)
+        index.tables = self.tables.with_pack_sizes(flags)
+        index.content_key = content_hash
+        index.boms = RecipeBoms(index.tables, index.bounds, content_hash)
+        return index
+
+class StationData:
+    """A loaded station sheet reduced to its RecipeIndex and content hash.
+
+    The all-string sheet is dropped once parsed, so a cached station holds only
+    its typed tables. version, the frame's attrs["snapshot_version"] if any,
+    identifies the snapshot it was decoded from, so the same snapshot read again
+    is recognised without hashing it.
+    """
+
+    def __init__(self, index, content_hash, version=None):
+        self.index = index
+        self.content_hash = content_hash
+        self.version = version
+
+    @classmethod
+    def from_frame(cls, df, previous=None):
+        """Parse df, or return previous when df holds the same data"""
+        version = df.attrs.get("snapshot_version")
+        if previous is not None and version is not None and previous.version == version:
+            return previous
+        content_hash = station_data_hash(df)
+        if previous is not None and previous.content_hash == content_hash:
+            return previous
+        return cls(RecipeIndex(df, content_hash), content_hash, version)
+
+    def pack_rows(self, recipe):
+        """{pack size: sheet row label} of a recipe, for writing its flags"""
+        return self.index.tables.pack_rows(self.index.bounds[recipe][0])
+
+    def with_pack_sizes(self, flags):
+        """Copy with {row label: available} applied, as the sheet will read once the write lands"""
+        content_hash = hashlib.sha1(f"{self.content_hash}{sorted(flags.items())}".encode()).hexdigest()
+        return StationData(self.index.with_pack_sizes(flags, content_hash), content_hash)
+
+def find_pack_size_rows(df, start_row, end_row):
+    """Map each pack size of a recipe section to its row label in the loaded sheet"""
+    section = df.loc[start_row:end_row - 1]
+    col_a, col_b, col_c = (_clean_column(section, col) for col in range(3))
+    is_pack_row = _pack_row_mask(col_a, col_b, col_c)
+    pack_rows = {}
+    for row_idx, size in col_c[is_pack_row].items():
+        pack_rows.setdefault(size, row_idx)
+    return pack_rows
+
+_FORMATTED_NUMBER = r"\s*[₱$]?\s*-?[\d,]*\.?\d+\s*"
+
+def _to_number(values):
+    """Floats from sheet display text such as '12.5', '1,250.50' or '₱320.00'; NaN where not numeric"""
+    numbers = pd.to_numeric(values, errors="coerce").astype(float)
+    # Only a single number with a currency sign or thousands separators; '1:30' or '2 x 500g' stay NaN
+    retry = numbers.isna() & values.str.fullmatch(_FORMATTED_NUMBER).fillna(False).astype(bool)
+    if retry.any():
+        cleaned = values[retry].str.replace(r"[₱$,\s]", "", regex=True)
+        numbers[retry] = pd.to_numeric(cleaned, errors="coerce")
+    return numbers
+
+def _optional_float(value):
+    return None if pd.isna(value) else float(value)
+
+@timed("parse_station_tables")
+def parse_station_tables(df, section_rows=None):
+    """Classify every row of a station sheet in one vectorized pass into StationTables.
+
+    A section runs from its INTERNAL NAME marker until the next marker, or for at
+    most section_rows rows if given.
+    """
+    if df is None or df.empty:
+        df = pd.DataFrame(columns=range(10), dtype=object)
+
+    col_a, col_b, col_c, col_d = (_clean_column(df, col) for col in range(4))
+    col_f, col_g, col_h, col_i, col_j = (_clean_column(df, col) for col in range(5, 10))
+
+    # Assign each row to the most recent INTERNAL NAME marker above it
+    positions = pd.Series(range(len(df)), index=df.index)
+    is_marker = _marker_mask(df)
+    section_pos = positions.where(is_marker).ffill()
+    in_section = section_pos.notna()
+    if section_rows is not None:
+        in_section &= positions - section_pos < section_rows
+    section = pd.Series(df.index, index=df.index).where(is_marker).ffill()
+
+    cells = pd.DataFrame({"section": section, "a": col_a, "b": col_b, "c": col_c, "d": col_d,
+                          "f": col_f, "g": col_g, "h": col_h, "i": col_i, "j": col_j})[in_section]
+    cells["section"] = cells["section"].astype(np.int64)
+    col_a, col_b, col_c, col_f, col_g, col_h, col_i, col_j = (cells[k] for k in "abcfghij")
+
+    spec_rows = cells.loc[col_a == "Standard Batch Size"]
+    specs = pd.DataFrame({
+        "section": spec_rows["section"].to_numpy(),
+        "SPECIFICATIONS": spec_rows["a"].to_numpy(),
+        "Value": spec_rows["b"].to_numpy(),
+        "UOM": spec_rows["c"].to_numpy()
+    })
+
+    final_output = cells.loc[col_a == "Final Net Output (yielded weight)"].groupby("section", sort=False)["b"].last()
+
+    pack_rows = cells.loc[_pack_row_mask(col_a, col_b, col_c)]
+    pack_sizes = pd.DataFrame({
+        "section": pack_rows["section"].to_numpy(),
+        "row": pack_rows.index.to_numpy(),
+        "size": pd.Categorical(pack_rows["c"]),
+        "grams": pd.to_numeric(pack_rows["c"].str.extract(r"(\d+)", expand=False), errors="coerce")
+                   .astype("Int32").to_numpy(),
+        "available": (pack_rows["b"] == "TRUE").to_numpy()
+    })
+
+    # Base recipe yield and batches: first row with a numeric yield in column F
+    yield_mask = ((col_f != "") & (col_g != "") & (col_f != "RECIPE YIELD (Unportioned)")
+                  & pd.to_numeric(col_f, errors="coerce").notna())
+    yields = cells.loc[yield_mask].groupby("section", sort=False)[["f", "g"]].first()
+
+    ingredient_mask = ((col_h != "") & (col_i != "") & (col_j != "") & (col_j != "INTERNAL NAME")
+                       & pd.to_numeric(col_h, errors="coerce").notna())
+    ingredient_rows = cells.loc[ingredient_mask]
+    ingredients = pd.DataFrame({
+        "section": ingredient_rows["section"].to_numpy(),
+        "QTY": pd.to_numeric(ingredient_rows["h"]).astype(float).to_numpy(),
+        "BATCH QTY": _to_number(ingredient_rows["i"]).to_numpy(),
+        "INTERNAL NAME": pd.Categorical(ingredient_rows["j"])
+    })
+
+    labor_rows = cells.loc[col_a.isin(LABOR_DEPARTMENTS)]
+    labor = pd.DataFrame({
+        "section": labor_rows["section"].to_numpy(),
+        LABOR_COLUMNS[0]: pd.Categorical(labor_rows["a"], categories=LABOR_DEPARTMENTS),
+        LABOR_COLUMNS[1]: pd.Categorical(labor_rows["b"]),
+        LABOR_COLUMNS[2]: _to_number(labor_rows["c"]).to_numpy(),
+        LABOR_COLUMNS[3]: _to_number(labor_rows["d"]).to_numpy()
+    })
+
+    # Internal name and SKU are the raw column B values of the first two section rows
+    col_b_raw = df.iloc[:, 1] if df.shape[1] > 1 else pd.Series(None, index=df.index, dtype=object)
+    marker_pos = np.flatnonzero(is_marker.to_numpy())
+    start_rows = df.index[marker_pos]
+    skus = col_b_raw.reindex(df.index[np.minimum(marker_pos + 1, len(df) - 1)])
+    recipes = pd.DataFrame({
+        "internal_name": col_b_raw.iloc[marker_pos].fillna("").astype(str).to_numpy(),
+        "sku_code": skus.where(marker_pos + 1 < len(df)).fillna("").astype(str).to_numpy(),
+        "recipe_yield": _to_number(yields["f"]).reindex(start_rows).to_numpy(),
+        "recipe_batches": _to_number(yields["g"]).reindex(start_rows).to_numpy(),
+        "final_net_output": _to_number(final_output).reindex(start_rows).to_numpy()
+    }, index=start_rows)
+
+    return StationTables(recipes, specs, ingredients, labor, pack_sizes)
+
+@timed("parse_station_sheet")
+def parse_station_sheet(df, section_rows=None):
+    """Parse every recipe of a station sheet at once.
+
+    Returns {start_row: RecipeBom} for every recipe section, where start_row is the
+    index label of the INTERNAL NAME marker row.
+    """
+    tables = parse_station_tables(df, section_rows)
+    return {start_row: tables.bom(start_row) for start_row in tables.recipes.index}
+
+@timed("extract_bom_data")
+def extract_bom_data(df, start_row):
+    section = df.loc[start_row:]
+    markers = np.flatnonzero(_marker_mask(section).to_numpy())
+    if len(markers) > 1:
+        section = section.iloc[:markers[1]]
+    return parse_station_sheet(section).get(start_row)
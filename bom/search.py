@@ -0,0 +1,150 @@
+"""Where-used index and name search across the recipes of every station"""
+
+import bisect
+import difflib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .explosion import _recipe_key
+from .metrics import timed
+
+WHERE_USED_COLUMNS = ["STATION", "RECIPE", "LEVEL", "VIA", "QTY", "LINES"]
+
+SEARCH_COLUMNS = ["NAME", "KIND", "STATIONS", "MATCH"]
+
+@timed("where_used_postings")
+def _station_postings(station, recipe_index):
+    """One row per (ingredient, recipe) of a station: summed QTY per batch and line count, sorted by KEY"""
+    ingredients = recipe_index.tables.ingredients
+    names = ingredients["INTERNAL NAME"]
+    category_keys = np.array([_recipe_key(name) for name in names.cat.categories], dtype=object)
+
+    lines = pd.DataFrame({
+        "KEY": category_keys[names.cat.codes.to_numpy()],
+        "INGREDIENT": names.astype(object).to_numpy(),
+        "RECIPE": ingredients["section"].map(recipe_index.section_names).to_numpy(),
+        "QTY": ingredients["QTY"].to_numpy()
+    }).dropna(subset=["RECIPE"])
+
+    postings = lines.groupby(["KEY", "RECIPE"], sort=True).agg(
+        INGREDIENT=("INGREDIENT", "first"), QTY=("QTY", "sum"), LINES=("QTY", "size")
+    ).reset_index()
+    postings.insert(0, "STATION", station)
+    return postings
+
+class WhereUsedIndex:
+    """Inverted INGREDIENT -> recipes index over every station, plus name search.
+
+    Postings are kept per station and rebuilt only when update() is handed a new
+    RecipeIndex for that station, so refreshing one sheet leaves the others alone.
+    Lookups binary-search each station's sorted postings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stations = {}
+        self._vocabulary = None
+
+    def update(self, station, recipe_index):
+        """Reindex station unless recipe_index is the one already indexed; True if rebuilt"""
+        with self._lock:
+            indexed = self._stations.get(station)
+            if indexed is not None and indexed[0] is recipe_index:
+                return False
+        postings = _station_postings(station, recipe_index)
+        with self._lock:
+            self._stations[station] = (recipe_index, postings, postings["KEY"].to_numpy())
+            self._vocabulary = None
+        return True
+
+    def remove(self, station):
+        with self._lock:
+            if self._stations.pop(station, None) is not None:
+                self._vocabulary = None
+
+    @timed("where_used")
+    def where_used(self, ingredient, indirect=False):
+        """Recipes using an ingredient, with QTY per batch of the recipe.
+
+        LEVEL 1 rows use the ingredient directly. With indirect, recipes that use
+        it through sub-recipes follow at LEVEL 2, 3, ... with VIA naming the
+        sub-recipe line that carries it.
+        """
+        with self._lock:
+            stations = [(postings, keys) for _, postings, keys in self._stations.values()]
+
+        # Row positions into each station's postings, with the LEVEL and VIA of each row
+        hits = [([], [], []) for _ in stations]
+        frontier = {_recipe_key(ingredient): ""}
+        seen = set(frontier)
+        level = 1
+        while frontier:
+            next_frontier = {}
+            for (postings, keys), (positions, levels, vias) in zip(stations, hits):
+                for key, via in frontier.items():
+                    lo, hi = keys.searchsorted(key, "left"), keys.searchsorted(key, "right")
+                    if hi == lo:
+                        continue
+                    positions.extend(range(lo, hi))
+                    levels.extend([level] * (hi - lo))
+                    vias.extend([via] * (hi - lo))
+                    if indirect:
+                        for recipe in postings["RECIPE"].iloc[lo:hi]:
+                            recipe_key = _recipe_key(recipe)
+                            if recipe_key not in seen:
+                                seen.add(recipe_key)
+                                next_frontier[recipe_key] = recipe
+            frontier = next_frontier
+            level += 1
+
+        frames = [postings.iloc[positions].assign(LEVEL=levels, VIA=vias)
+                  for (postings, _), (positions, levels, vias) in zip(stations, hits) if positions]
+        if not frames:
+            return pd.DataFrame(columns=WHERE_USED_COLUMNS)
+        used = pd.concat(frames, ignore_index=True)[WHERE_USED_COLUMNS]
+        return used.sort_values(["LEVEL", "QTY"], ascending=[True, False], ignore_index=True)
+
+    def _build_vocabulary(self, stations):
+        entries = {}
+        for station, (recipe_index, postings, _) in stations:
+            for name in recipe_index.names:
+                entries.setdefault((_recipe_key(name), "recipe"), [name, set()])[1].add(station)
+            for key, name in zip(postings["KEY"], postings["INGREDIENT"]):
+                entries.setdefault((key, "ingredient"), [name, set()])[1].add(station)
+        ordered = sorted(entries.items())
+        return ([key for (key, _), _ in ordered],
+                [(name, kind, ", ".join(sorted(used_in))) for (_, kind), (name, used_in) in ordered])
+
+    @timed("name_search")
+    def search(self, query, limit=20):
+        """Recipe and ingredient names matching query: prefix matches first, then substring, then fuzzy"""
+        key = _recipe_key(query)
+        with self._lock:
+            if self._vocabulary is None:
+                self._vocabulary = self._build_vocabulary(list(self._stations.items()))
+            keys, entries = self._vocabulary
+        if not key:
+            return pd.DataFrame(columns=SEARCH_COLUMNS)
+
+        matches = {}
+        position = bisect.bisect_left(keys, key)
+        while position < len(keys) and keys[position].startswith(key) and len(matches) < limit:
+            matches[position] = "prefix"
+            position += 1
+        for position, candidate in enumerate(keys):
+            if len(matches) >= limit:
+                break
+            if key in candidate and position not in matches:
+                matches[position] = "contains"
+        if len(matches) < limit:
+            positions = {}
+            for position, candidate in enumerate(keys):
+                positions.setdefault(candidate, []).append(position)
+            for candidate in difflib.get_close_matches(key, list(positions), n=limit, cutoff=0.6):
+                for position in positions[candidate]:
+                    matches.setdefault(position, "fuzzy")
+
+        rows = [entries[position] + (match,) for position, match in list(matches.items())[:limit]]
+        return pd.DataFrame(rows, columns=SEARCH_COLUMNS)
@@ -0,0 +1,446 @@
+"""Google Sheets access: pooled session, on-disk snapshots and the shared station cache.
+
+gspread and google-auth are imported lazily so the parsing and calculation
+modules can be used without them.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from .governor import BACKGROUND, govern_http_client, request_priority
+from .metrics import METRICS, instrument_http_client, timed
+from .parsing import StationData
+
+SPREADSHEET_KEY = "17jeWWOaREFg6QMqDpQX-T3LYsETR7F4iZvWS5lC0I3w"
+
+STATIONS = ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"]
+
+# Map station to worksheet index
+STATION_SHEET_MAP = {
+    "Butchery": 2,
+    "Hot Kitchen": 3,
+    "Cold Kitchen": 4,
+    "Pastry": 5
+}
+
+def station_worksheet(station_sheets, station):
+    """A station's worksheet: its index in station_sheets, otherwise its name as the worksheet title"""
+    return station_sheets.get(station, station)
+
+class PackSizeRowError(ValueError):
+    """Pack-size rows that no longer hold their size in column C: the sheet changed since it was loaded"""
+
+    def __init__(self, station, sizes):
+        super().__init__(f"{station} changed since it was loaded, {', '.join(sizes)} not written; reload and try again")
+        self.station = station
+        self.sizes = sizes
+
+def split_moved_pack_sizes(pack_rows, changes, column_c):
+    """({size: available} still at their row, [sizes moved away]) given {row: column C text} of the live sheet"""
+    current = {size: available for size, available in changes.items()
+               if str(column_c.get(pack_rows[size], "")).strip() == size}
+    return current, [size for size in changes if size not in current]
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+def credentials_from_service_account_info(info):
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_info(info, scopes=SCOPES)
+
+def credentials_from_service_account_file(path):
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_file(path, scopes=SCOPES)
+
+class SheetsSession:
+    """Long-lived Sheets client: one authorized HTTP session, the opened
+    spreadsheet and a map of worksheet handles.
+
+    gspread's client runs on google-auth's AuthorizedSession, a requests
+    session that keeps connections alive and refreshes the access token
+    transparently, so the session can be shared for the life of the process.
+    Every request goes through the process-wide SHEETS_GOVERNOR.
+    """
+
+    def __init__(self, credentials, spreadsheet_key=SPREADSHEET_KEY, station_sheets=STATION_SHEET_MAP):
+        import gspread
+        self.client = gspread.authorize(credentials)
+        # The governor wraps the instrumented client, so deduplicated calls aren't counted as requests
+        govern_http_client(instrument_http_client(self.client.http_client))
+        self.spreadsheet = self.client.open_by_key(spreadsheet_key)
+        self.station_sheets = station_sheets
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    def worksheet(self, station):
+        sheet = station_worksheet(self.station_sheets, station)
+        with self._lock:
+            if sheet not in self._worksheets:
+                # One metadata request opens every worksheet handle, by index and by title
+                worksheets = self.spreadsheet.worksheets()
+                self._worksheets = {**dict(enumerate(worksheets)), **{ws.title: ws for ws in worksheets}}
+            if sheet not in self._worksheets:
+                raise KeyError(f"No worksheet {sheet!r} for station {station}")
+            return self._worksheets[sheet]
+
+    def _retry_with_fresh_worksheets(self, call):
+        """call(), once more with reopened worksheet handles if the API rejects a range.
+
+        Handles carry the title they were opened with; after a tab is renamed
+        every range built from them fails with 400 until they are reopened.
+        """
+        from gspread.exceptions import APIError
+        try:
+            return call()
+        except APIError as e:
+            if e.code != 400:
+                raise
+            with self._lock:
+                self._worksheets = {}
+            return call()
+
+    def batch_get_values(self, stations):
+        """Values of several station worksheets in one values:batchGet request"""
+        from gspread.utils import absolute_range_name, fill_gaps
+
+        def batch_get():
+            worksheets = [self.worksheet(station) for station in stations]
+            return self.spreadsheet.values_batch_get([absolute_range_name(ws.title) for ws in worksheets])
+
+        response = self._retry_with_fresh_worksheets(batch_get)
+        return {
+            station: fill_gaps(value_range.get("values", [[]]))
+            for station, value_range in zip(stations, response["valueRanges"])
+        }
+
+    def modified_time(self):
+        """Drive modifiedTime of the spreadsheet, a cheap metadata-only request"""
+        return self.spreadsheet.get_lastUpdateTime()
+
+    def write_pack_sizes(self, station, pack_rows, changes):
+        """Write {pack_size: available} flags to column B of their rows in one batch_update.
+
+        pack_rows come from data that may be minutes old, so one batchGet of B:C
+        first checks every row still holds its size in column C; only those are
+        written, and PackSizeRowError is raised for the rest.
+        """
+        from gspread.utils import ValueInputOption, absolute_range_name, rowcol_to_a1
+
+        def write():
+            worksheet = self.worksheet(station)
+            rows = [pack_rows[size] + 1 for size in changes]
+            response = self.spreadsheet.values_batch_get(
+                [absolute_range_name(worksheet.title, f"B{row}:C{row}") for row in rows]
+            )
+            column_c = {
+                row - 1: (value_range.get("values", [[]])[0] + ["", ""])[1]
+                for row, value_range in zip(rows, response["valueRanges"])
+            }
+            current, moved = split_moved_pack_sizes(pack_rows, changes, column_c)
+            if current:
+                worksheet.batch_update(
+                    [
+                        {"range": rowcol_to_a1(pack_rows[size] + 1, 2), "values": [["TRUE" if available else "FALSE"]]}
+                        for size, available in current.items()
+                    ],
+                    value_input_option=ValueInputOption.user_entered
+                )
+            return moved
+
+        moved = self._retry_with_fresh_worksheets(write)
+        if moved:
+            raise PackSizeRowError(station, moved)
+
+STATION_DATA_TTL = 60
+
+# Background refresh cadence in seconds (0 disables) and its random spread as a fraction
+REFRESH_INTERVAL = float(os.environ.get("BOM_REFRESH_INTERVAL", STATION_DATA_TTL))
+REFRESH_JITTER = float(os.environ.get("BOM_REFRESH_JITTER", "0.1"))
+
+SNAPSHOT_PATH = os.environ.get("BOM_SNAPSHOT_PATH", ".bom_snapshots.sqlite3")
+
+# Seconds after a local write during which data read back may still predate it: Drive's
+# modifiedTime lags behind writes, and a read in flight before the write can be shared after it
+WRITE_SETTLE_SECONDS = float(os.environ.get("BOM_WRITE_SETTLE_SECONDS", "30"))
+
+class SnapshotStore:
+    """On-disk snapshots of worksheet values in SQLite, keyed by spreadsheet and worksheet index or title.
+
+    Each snapshot records the spreadsheet's Drive modifiedTime so a refresh can
+    skip the download when nothing changed, and serves as the fallback when the
+    API is unreachable. Frames from load_frame and save carry the snapshot they
+    came from in attrs["snapshot_version"], so StationData.from_frame can tell an
+    unchanged snapshot apart without hashing it. A worksheet written from this
+    process is downloaded again until a snapshot saved WRITE_SETTLE_SECONDS
+    after the write, whatever its modifiedTime says.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._written_at = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "spreadsheet_key TEXT, worksheet_index INTEGER, modified_time TEXT, "
+                "fetched_at REAL, data_json TEXT, PRIMARY KEY (spreadsheet_key, worksheet_index))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, spreadsheet_key, worksheet_index):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT modified_time, fetched_at, data_json FROM snapshots "
+                "WHERE spreadsheet_key = ? AND worksheet_index = ?",
+                (spreadsheet_key, worksheet_index)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"modified_time": row[0], "fetched_at": row[1], "values": json.loads(row[2])}
+
+    def load_frame(self, spreadsheet_key, worksheet_index):
+        """{"modified_time", "df"} of a snapshot, or None"""
+        snapshot = self.load(spreadsheet_key, worksheet_index)
+        if snapshot is None:
+            return None
+        return {"modified_time": snapshot["modified_time"], "fetched_at": snapshot["fetched_at"],
+                "df": _snapshot_frame(snapshot["values"], (spreadsheet_key, worksheet_index, snapshot["fetched_at"]))}
+
+    def save(self, spreadsheet_key, worksheet_index, values, modified_time):
+        """Store values and return their snapshot frame, as load_frame"""
+        fetched_at = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                (spreadsheet_key, worksheet_index, modified_time, fetched_at, json.dumps(values))
+            )
+        return {"modified_time": modified_time, "fetched_at": fetched_at,
+                "df": _snapshot_frame(values, (spreadsheet_key, worksheet_index, fetched_at))}
+
+    def mark_written(self, spreadsheet_key, worksheet_index):
+        """Expire a worksheet's snapshot after writing to it, so its next fetch downloads it"""
+        with self._lock:
+            self._written_at[(spreadsheet_key, worksheet_index)] = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE snapshots SET modified_time = NULL WHERE spreadsheet_key = ? AND worksheet_index = ?",
+                (spreadsheet_key, worksheet_index)
+            )
+
+    def is_settled(self, spreadsheet_key, worksheet_index, snapshot):
+        """False while a snapshot may predate this process's last write to the worksheet"""
+        with self._lock:
+            written_at = self._written_at.get((spreadsheet_key, worksheet_index))
+        return written_at is None or snapshot["fetched_at"] > written_at + WRITE_SETTLE_SECONDS
+
+def _snapshot_frame(values, version):
+    df = pd.DataFrame(values)
+    df.attrs["snapshot_version"] = version
+    return df
+
+def load_snapshot_frame(store, station, spreadsheet_key=SPREADSHEET_KEY, station_sheets=STATION_SHEET_MAP):
+    """Last on-disk snapshot of a station as a DataFrame, or None"""
+    snapshot = store.load_frame(spreadsheet_key, station_worksheet(station_sheets, station))
+    return snapshot["df"] if snapshot else None
+
+@timed("fetch_stations_data")
+def fetch_stations_data(session, store, stations, spreadsheet_key=SPREADSHEET_KEY, station_sheets=STATION_SHEET_MAP):
+    """Download several station worksheets as all-string DataFrames, {station: df}.
+
+    One metadata request checks the spreadsheet's modifiedTime; stations whose
+    on-disk snapshot is current are served from it and the rest are fetched
+    together in a single batchGet. Snapshots are served if the API is unreachable
+    or there is no session, as None for a station without one; the error is only
+    raised when none of the stations has a snapshot. session may also be a
+    callable that opens one.
+    """
+    import gspread
+    import requests
+    from google.auth.exceptions import GoogleAuthError
+
+    snapshots = {station: store.load_frame(spreadsheet_key, station_worksheet(station_sheets, station))
+                 for station in stations}
+    
+    def from_snapshots():
+        return {station: snapshot["df"] if snapshot else None for station, snapshot in snapshots.items()}
+    
+    try:
+        if callable(session):
+            session = session()
+        if not session:
+            return from_snapshots()
+        
+        modified_time = session.modified_time()
+        outdated = [station for station, snapshot in snapshots.items()
+                    if not snapshot or snapshot["modified_time"] != modified_time
+                    or not store.is_settled(spreadsheet_key, station_worksheet(station_sheets, station), snapshot)]
+        fetched = session.batch_get_values(outdated) if outdated else {}
+        for station, data in fetched.items():
+            snapshots[station] = store.save(spreadsheet_key, station_worksheet(station_sheets, station), data,
+                                            modified_time)
+        
+        return from_snapshots()
+    except (gspread.exceptions.GSpreadException, GoogleAuthError, requests.exceptions.RequestException, KeyError):
+        if any(snapshots.values()):
+            METRICS.inc("station_fetch_fallback_total")
+            return from_snapshots()
+        raise
+
+class StationDataCache:
+    """Process-wide, stale-while-revalidate station data shared by every session.
+
+    fetch takes a list of stations and returns {station: df}; load_snapshot,
+    if given, returns a station's last on-disk snapshot. Each sheet is parsed
+    into a StationData as it arrives and the raw frame dropped; a refresh that
+    returns the same data keeps the parsed one. Entries older than ttl seconds
+    are still served immediately while they are refreshed in the background;
+    only a station with no data at all is fetched in the caller's thread,
+    together with every other missing or expired station. With
+    start_refresher, a daemon thread also refreshes every station on a jittered
+    cadence, so readers rarely see an expired entry. Entries are replaced whole
+    under the lock (writes are patched into a copy), so StationData handed out
+    is never modified afterwards. A patched entry is kept over any refresh
+    started less than write_settle seconds after the patch, which may still
+    read the sheet as it was before the write.
+    """
+
+    def __init__(self, fetch, stations=None, ttl=STATION_DATA_TTL, load_snapshot=None,
+                 write_settle=WRITE_SETTLE_SECONDS):
+        self.stations = list(stations or STATIONS)
+        self.fetch = fetch
+        self.ttl = ttl
+        self.write_settle = write_settle
+        self.load_snapshot = load_snapshot
+        self._entries = {}
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop_refresher = threading.Event()
+
+    def _is_expired(self, entry, now):
+        return entry is None or entry["data"] is None or now - entry["fetched_at"] > self.ttl
+
+    def _due_stations(self):
+        now = time.time()
+        with self._lock:
+            return [station for station in self.stations if self._is_expired(self._entries.get(station), now)]
+
+    def get(self, station):
+        """StationData of a station, or None if it couldn't be loaded"""
+        with self._lock:
+            entry = self._entries.get(station)
+        if entry is None and self.load_snapshot:
+            # Cold start: serve the on-disk snapshots right away and revalidate them
+            data = self.seed_from_snapshots(station)
+            if data is not None:
+                return data
+        if entry is None or entry["data"] is None:
+            # Nothing to serve: fetch every due station with this one in a single batch
+            due = self._due_stations()
+            return self.refresh(due if station in due else due + [station])[station]
+        if entry["stale"] or self._is_expired(entry, time.time()):
+            # Serve what we have and refresh every due station behind it
+            METRICS.inc("station_cache_stale_served_total", station=station)
+            self.revalidate_async(sorted(set(self._due_stations()) | {station}))
+        return entry["data"]
+
+    def seed_from_snapshots(self, station):
+        seeded = []
+        for name in self.stations + ([station] if station not in self.stations else []):
+            df = self.load_snapshot(name)
+            if df is not None:
+                data = StationData.from_frame(df)
+                with self._lock:
+                    if name not in self._entries:
+                        self._entries[name] = {"data": data, "fetched_at": time.time(), "patched_at": 0.0,
+                                               "stale": True}
+                        seeded.append(name)
+        if seeded:
+            self.revalidate_async(seeded)
+        with self._lock:
+            entry = self._entries.get(station)
+        return entry["data"] if entry else None
+
+    @timed("station_refresh")
+    def refresh(self, stations):
+        """Fetch and parse stations; returns {station: StationData or None}"""
+        started_at = time.time()
+        frames = self.fetch(stations)
+        with self._lock:
+            previous = {station: (self._entries.get(station) or {}).get("data") for station in frames}
+        parsed = {station: None if df is None else StationData.from_frame(df, previous[station])
+                  for station, df in frames.items()}
+        with self._lock:
+            for station, data in parsed.items():
+                entry = self._entries.get(station)
+                if entry is not None and entry["patched_at"] > started_at - self.write_settle:
+                    # A write patched while or shortly before we were downloading may not be
+                    # in the data yet: keep the patched data and revalidate it again
+                    parsed[station] = entry["data"]
+                    self._entries[station] = dict(entry, stale=True)
+                else:
+                    self._entries[station] = {"data": data, "fetched_at": started_at, "patched_at": 0.0, "stale": False}
+        return parsed
+
+    def patch(self, station, flags):
+        """Apply {row_label: available} pack-size flags to a copy of the cached data and mark it for revalidation"""
+        with self._lock:
+            entry = self._entries.get(station)
+            if entry is None or entry["data"] is None:
+                return
+            self._entries[station] = dict(entry, data=entry["data"].with_pack_sizes(flags), patched_at=time.time(),
+                                          stale=True)
+        self.revalidate_async([station])
+
+    def _claim(self, stations):
+        """Stations not already being refreshed, now marked as being refreshed"""
+        with self._lock:
+            stations = [station for station in stations if station not in self._revalidating]
+            self._revalidating.update(stations)
+        return stations
+
+    def _refresh_claimed(self, stations):
+        try:
+            with request_priority(BACKGROUND):
+                self.refresh(stations)
+        except Exception:
+            # Keep serving the cached data; the next access or refresher tick retries
+            METRICS.inc("station_refresh_errors_total")
+        finally:
+            with self._lock:
+                self._revalidating.difference_update(stations)
+
+    def revalidate_async(self, stations):
+        stations = self._claim(stations)
+        if stations:
+            threading.Thread(target=self._refresh_claimed, args=(stations,),
+                             name=f"revalidate-{'-'.join(stations)}", daemon=True).start()
+
+    def start_refresher(self, interval=REFRESH_INTERVAL, jitter=REFRESH_JITTER):
+        """Refresh every station on a daemon thread every interval seconds, spread by +/- jitter * interval"""
+        if interval <= 0 or self._refresher is not None:
+            return self._refresher
+        self._stop_refresher.clear()
+
+        def run():
+            while not self._stop_refresher.wait(interval * (1 + random.uniform(-jitter, jitter))):
+                stations = self._claim(self.stations)
+                if stations:
+                    self._refresh_claimed(stations)
+
+        self._refresher = threading.Thread(target=run, name="station-refresher", daemon=True)
+        self._refresher.start()
+        return self._refresher
+
+    def stop_refresher(self):
+        self._stop_refresher.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
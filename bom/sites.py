@@ -0,0 +1,158 @@
+"""Registry of commissary sites, each with its own spreadsheet of station sheets in the same layout.
+
+Every site has its own station cache, so sites load in parallel and refresh
+independently: a slow or unreachable sheet only holds up its own site.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from .explosion import BOMExplosion
+from .metrics import span
+from .sheets import SPREADSHEET_KEY, STATION_SHEET_MAP, STATIONS, station_worksheet
+from .sources import DATA_SOURCE, open_data_source
+
+SITES_CONFIG = os.environ.get("BOM_SITES", "")
+
+DEFAULT_SITE = "Main"
+
+# Seconds the consolidated views wait for all sites before showing the ones loaded
+SITE_LOAD_TIMEOUT = float(os.environ.get("BOM_SITE_LOAD_TIMEOUT", "20"))
+
+CONSOLIDATED_RECIPE_COLUMNS = ["SITE", "STATION", "RECIPE", "SKU CODE", "RECIPE YIELD", "RECIPE BATCHES",
+                               "FINAL NET OUTPUT"]
+
+class Site:
+    """One kitchen: its data source spec, spreadsheet key and {station: worksheet index or title}"""
+
+    def __init__(self, name, source=DATA_SOURCE, spreadsheet_key=SPREADSHEET_KEY, stations=None):
+        self.name = name
+        self.source = source
+        self.spreadsheet_key = spreadsheet_key
+        if stations is None:
+            stations = {station: STATION_SHEET_MAP[station] for station in STATIONS}
+        elif not isinstance(stations, dict):
+            # A list of names: known stations keep their worksheet index, others are found by title
+            stations = {station: station_worksheet(STATION_SHEET_MAP, station) for station in stations}
+        self.stations = stations
+
+    @property
+    def station_names(self):
+        return list(self.stations)
+
+    def open_source(self, session=None, store=None):
+        """The site's DataSource; session is a SheetsSession or a callable opening one"""
+        return open_data_source(self.source, session=session, store=store,
+                                spreadsheet_key=self.spreadsheet_key, station_sheets=self.stations)
+
+def load_sites(spec=SITES_CONFIG, source=DATA_SOURCE):
+    """Sites from a JSON registry file, or the single default site reading source.
+
+    The file holds a list of sites (or {"sites": [...]}), each with a name and
+    optionally a source spec (default 'sheets'), a spreadsheet_key and stations,
+    either {station: worksheet index or title} or a list of station names.
+    """
+    if not spec:
+        return [Site(DEFAULT_SITE, source)]
+    with open(spec) as f:
+        configured = json.load(f)
+    if isinstance(configured, dict):
+        configured = configured.get("sites", [])
+
+    sites = []
+    for entry in configured:
+        if "name" not in entry:
+            raise ValueError(f"Site without a name in {spec}")
+        if any(site.name == entry["name"] for site in sites):
+            raise ValueError(f"Duplicate site: {entry['name']}")
+        sites.append(Site(entry["name"], entry.get("source", "sheets"),
+                          entry.get("spreadsheet_key", SPREADSHEET_KEY), entry.get("stations")))
+    if not sites:
+        raise ValueError(f"No sites configured in {spec}")
+    return sites
+
+class SiteDataCache:
+    """Station data of every site, one StationDataCache each, loaded in parallel.
+
+    open_cache(site) builds a site's StationDataCache. load_all fetches every
+    site on its own worker thread; sites not loaded within the timeout keep
+    loading in the background and are reported instead of waited for.
+    """
+
+    def __init__(self, sites, open_cache):
+        self.sites = {site.name: site for site in sites}
+        self.caches = {site.name: open_cache(site) for site in sites}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.sites)), thread_name_prefix="site-load")
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, site, station):
+        return self.caches[site].get(station)
+
+    def _load_site(self, site):
+        with span("site_load", site=site):
+            cache = self.caches[site]
+            return {station: cache.get(station) for station in self.sites[site].station_names}
+
+    def load_all(self, timeout=SITE_LOAD_TIMEOUT):
+        """({site: {station: StationData}}, {site: problem}) for every site, waiting at most timeout seconds"""
+        with self._lock:
+            for site in self.sites:
+                # A site still loading from an earlier call is not submitted again
+                if site not in self._loading or self._loading[site].done():
+                    self._loading[site] = self._executor.submit(self._load_site, site)
+            futures = dict(self._loading)
+        wait(futures.values(), timeout=timeout)
+
+        data, problems = {}, {}
+        for site, future in futures.items():
+            if not future.done():
+                problems[site] = "still loading"
+            elif future.exception() is not None:
+                problems[site] = str(future.exception())
+            else:
+                data[site] = {station: station_data for station, station_data in future.result().items()
+                              if station_data is not None}
+        return data, problems
+
+def consolidated_recipes(site_indexes):
+    """One row per recipe of every site and station, from {site: {station: RecipeIndex}}"""
+    frames = []
+    for site, indexes in site_indexes.items():
+        for station, index in indexes.items():
+            recipes = index.tables.recipes
+            names = recipes.index.map(index.section_names).to_numpy()
+            named = pd.notna(names)
+            frames.append(pd.DataFrame({
+                "SITE": site,
+                "STATION": station,
+                "RECIPE": names[named],
+                "SKU CODE": recipes["sku_code"].to_numpy()[named],
+                "RECIPE YIELD": recipes["recipe_yield"].to_numpy()[named],
+                "RECIPE BATCHES": recipes["recipe_batches"].to_numpy()[named],
+                "FINAL NET OUTPUT": recipes["final_net_output"].to_numpy()[named]
+            }))
+    if not frames:
+        return pd.DataFrame(columns=CONSOLIDATED_RECIPE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def consolidated_ingredient_totals(site_indexes):
+    """Raw materials for every recipe at its RECIPE BATCHES, exploded through sub-recipes; one column per site plus TOTAL"""
+    totals = {}
+    for site, indexes in site_indexes.items():
+        plan = consolidated_recipes({site: indexes}).rename(columns={"RECIPE BATCHES": "BATCHES"})
+        if plan.empty:
+            continue
+        pick_list, _ = BOMExplosion(indexes).explode_plan(plan[["RECIPE", "BATCHES"]])
+        totals[site] = pick_list.set_index("INTERNAL NAME")["TOTAL QTY"]
+
+    if not totals:
+        return pd.DataFrame(columns=["INTERNAL NAME", "TOTAL"])
+    table = pd.DataFrame(totals).fillna(0)
+    table["TOTAL"] = table.to_numpy().sum(axis=1)
+    table = table.round(3).sort_values("TOTAL", ascending=False)
+    return table.rename_axis("INTERNAL NAME").reset_index()
@@ -0,0 +1,226 @@
+"""Pluggable station data sources: Google Sheets, a local XLSX workbook or CSV files.
+
+Every source returns the same all-string station layout that Google Sheets'
+get_all_values produces, so parsing and explosion work unchanged on top of it.
+"""
+
+import abc
+import csv
+import json
+import os
+import threading
+
+import pandas as pd
+
+from .metrics import timed
+
+from .sheets import (
+    SPREADSHEET_KEY,
+    STATION_SHEET_MAP,
+    PackSizeRowError,
+    SnapshotStore,
+    fetch_stations_data,
+    split_moved_pack_sizes,
+    station_worksheet,
+)
+
+DATA_SOURCE = os.environ.get("BOM_DATA_SOURCE", "sheets")
+
+class DataSource(abc.ABC):
+    """Interface for loading station sheets and writing pack-size flags"""
+
+    @abc.abstractmethod
+    def fetch(self, stations):
+        """{station: all-string DataFrame} for the requested stations"""
+
+    @abc.abstractmethod
+    def write_pack_sizes(self, station, pack_rows, changes):
+        """Write {pack_size: available} to column B of the 0-based rows in pack_rows"""
+
+def _rectangular_frame(rows):
+    """All-string DataFrame padded with '' like get_all_values"""
+    width = max((len(row) for row in rows), default=0)
+    return pd.DataFrame([list(row) + [""] * (width - len(row)) for row in rows])
+
+def _cell_text(value):
+    """Cell value as Google Sheets would display it"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class GoogleSheetsSource(DataSource):
+    """The shared Google spreadsheet, backed by the on-disk snapshot store.
+
+    session may be a callable that opens the session on first use. With no
+    session it replays the snapshot store, which is how saved sheet snapshots
+    are profiled offline.
+    """
+
+    def __init__(self, session, store, spreadsheet_key=SPREADSHEET_KEY, station_sheets=STATION_SHEET_MAP):
+        self.session = session
+        self.store = store
+        self.spreadsheet_key = spreadsheet_key
+        self.station_sheets = station_sheets
+
+    def fetch(self, stations):
+        return fetch_stations_data(self.session, self.store, stations, self.spreadsheet_key, self.station_sheets)
+
+    def write_pack_sizes(self, station, pack_rows, changes):
+        session = self.session() if callable(self.session) else self.session
+        if not session:
+            raise RuntimeError("No Google Sheets session: pack sizes can't be written")
+        try:
+            session.write_pack_sizes(station, pack_rows, changes)
+        finally:
+            # Even a failed write may have landed: don't trust the snapshot's modifiedTime for it
+            self.store.mark_written(self.spreadsheet_key, station_worksheet(self.station_sheets, station))
+
+class XlsxSource(DataSource):
+    """An .xlsx export of the spreadsheet, read with openpyxl in read-only streaming mode.
+
+    Station worksheets are found by name first, then by their station_sheets index.
+    The workbook itself is never written: saving it with openpyxl drops every
+    formula's cached value. Pack-size flags go to a JSON sidecar next to it,
+    '<path>.pack_sizes.json' holding {station: {row: {"size", "flag"}}}, which
+    fetch applies on top of the workbook only where column C of the row still
+    holds the size. The sidecar records the workbook's mtime and is dropped once
+    the workbook is replaced or edited.
+    """
+
+    def __init__(self, path, station_sheets=STATION_SHEET_MAP):
+        self.path = path
+        self.station_sheets = station_sheets
+        self.overrides_path = f"{path}.pack_sizes.json"
+        self._lock = threading.Lock()
+
+    def _read_overrides(self):
+        """{station: {row: {"size", "flag"}}} of the sidecar, or {} if there is none for this workbook"""
+        if not os.path.exists(self.overrides_path):
+            return {}
+        with open(self.overrides_path, encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if sidecar.get("workbook_mtime") != os.path.getmtime(self.path):
+            # Flags written against another version of the workbook: its rows may have moved
+            os.remove(self.overrides_path)
+            return {}
+        return sidecar["stations"]
+
+    def _worksheet(self, workbook, station):
+        if station in workbook.sheetnames:
+            return workbook[station]
+        sheet = station_worksheet(self.station_sheets, station)
+        if not isinstance(sheet, int) or sheet >= len(workbook.worksheets):
+            raise KeyError(f"No worksheet {sheet!r} for station {station} in {self.path}")
+        return workbook.worksheets[sheet]
+
+    @timed("xlsx_fetch")
+    def fetch(self, stations):
+        from openpyxl import load_workbook
+
+        with self._lock:
+            workbook = load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                data = {}
+                for station in stations:
+                    worksheet = self._worksheet(workbook, station)
+                    rows = [[_cell_text(value) for value in row]
+                            for row in worksheet.iter_rows(min_row=1, min_col=1, values_only=True)]
+                    data[station] = _rectangular_frame(rows)
+            finally:
+                workbook.close()
+            overrides = self._read_overrides()
+
+        for station, flags in overrides.items():
+            df = data.get(station)
+            if df is None or df.shape[1] < 3:
+                continue
+            for row, override in flags.items():
+                if int(row) < len(df) and df.iat[int(row), 2].strip() == override["size"]:
+                    df.iat[int(row), 1] = override["flag"]
+        return data
+
+    def _column_c(self, station, rows):
+        """{row: column C text} of 0-based rows of a station's worksheet"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            worksheet = self._worksheet(workbook, station)
+            column_c = {}
+            for row in rows:
+                cells = next(worksheet.iter_rows(min_row=row + 1, max_row=row + 1, min_col=3, max_col=3,
+                                                 values_only=True), (None,))
+                column_c[row] = _cell_text(cells[0])
+            return column_c
+        finally:
+            workbook.close()
+
+    def write_pack_sizes(self, station, pack_rows, changes):
+        with self._lock:
+            current, moved = split_moved_pack_sizes(
+                pack_rows, changes, self._column_c(station, [pack_rows[size] for size in changes])
+            )
+            overrides = self._read_overrides()
+            flags = overrides.setdefault(station, {})
+            for size, available in current.items():
+                flags[str(pack_rows[size])] = {"size": size, "flag": "TRUE" if available else "FALSE"}
+            # Replace the sidecar whole, so a concurrent reader never sees half a file
+            temp_path = f"{self.overrides_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"workbook_mtime": os.path.getmtime(self.path), "stations": overrides}, f, indent=2)
+            os.replace(temp_path, self.overrides_path)
+        if moved:
+            raise PackSizeRowError(station, moved)
+
+class CsvSource(DataSource):
+    """A directory with one headerless CSV per station, named '<station>.csv'"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, station):
+        return os.path.join(self.directory, f"{station}.csv")
+
+    def _read(self, station):
+        with open(self._path(station), newline="", encoding="utf-8") as f:
+            return [row for row in csv.reader(f)]
+
+    @timed("csv_fetch")
+    def fetch(self, stations):
+        with self._lock:
+            return {station: _rectangular_frame(self._read(station)) for station in stations}
+
+    def write_pack_sizes(self, station, pack_rows, changes):
+        with self._lock:
+            rows = self._read(station)
+            column_c = {pack_rows[size]: rows[pack_rows[size]][2]
+                        for size in changes if pack_rows[size] < len(rows) and len(rows[pack_rows[size]]) > 2}
+            current, moved = split_moved_pack_sizes(pack_rows, changes, column_c)
+            for size, available in current.items():
+                row = rows[pack_rows[size]]
+                row[1] = "TRUE" if available else "FALSE"
+            if current:
+                with open(self._path(station), "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f).writerows(rows)
+        if moved:
+            raise PackSizeRowError(station, moved)
+
+def open_data_source(spec=DATA_SOURCE, session=None, store=None, spreadsheet_key=SPREADSHEET_KEY,
+                     station_sheets=STATION_SHEET_MAP):
+    """Data source from a spec: 'sheets', 'snapshot:<sqlite path>', 'xlsx:<path>' or 'csv:<directory>'"""
+    kind, _, location = spec.partition(":")
+    if kind == "sheets":
+        return GoogleSheetsSource(session, store or SnapshotStore(), spreadsheet_key, station_sheets)
+    if kind == "snapshot":
+        return GoogleSheetsSource(None, SnapshotStore(location) if location else SnapshotStore(),
+                                  spreadsheet_key, station_sheets)
+    if kind == "xlsx":
+        return XlsxSource(location, station_sheets)
+    if kind == "csv":
+        return CsvSource(location)
+    raise ValueError(f"Unknown data source: {spec}")
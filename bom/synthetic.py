@@ -0,0 +1,63 @@
+"""Synthetic station sheets in the real block layout, for benchmarks and offline load tests"""
+
+import random
+
+import pandas as pd
+
+from .parsing import LABOR_DEPARTMENTS, PACK_SIZE_OPTIONS
+
+SHEET_COLUMNS = 12
+
+def _recipe_block(rng, name, sku, ingredient_names):
+    """Rows of one recipe section: header/specs/pack sizes in A:C, yield in F:G,
+    ingredients in H:J and the labor block below"""
+    labor_start = max(len(ingredient_names) + 2, 4 + len(PACK_SIZE_OPTIONS)) + 1
+    rows = [[""] * SHEET_COLUMNS for _ in range(labor_start + len(LABOR_DEPARTMENTS) + 2)]
+
+    rows[0][0], rows[0][1] = "INTERNAL NAME", name
+    rows[1][0], rows[1][1] = "SKU", sku
+    batch_size = rng.choice([5, 10, 20, 40])
+    rows[2][0:3] = ["Standard Batch Size", str(batch_size), "L"]
+    rows[3][0:2] = ["Final Net Output (yielded weight)", f"{batch_size * rng.uniform(0.7, 0.98):.2f}"]
+    for i, size in enumerate(PACK_SIZE_OPTIONS):
+        rows[4 + i][0:3] = ["Pack Size" if i == 0 else "", rng.choice(["TRUE", "FALSE"]), size]
+
+    rows[0][5:7] = ["RECIPE YIELD (Unportioned)", "RECIPE (# of Batches)"]
+    rows[1][5:7] = [str(batch_size), str(rng.randint(1, 4))]
+
+    rows[0][7:10] = ["QTY", "BATCH QTY", "INTERNAL NAME"]
+    for i, ingredient in enumerate(ingredient_names):
+        qty = f"{rng.uniform(0.05, 5):.3f}"
+        rows[1 + i][7:10] = [qty, qty, ingredient]
+
+    rows[labor_start][0:4] = ["LABOR PRODUCTIVITY (minutes)", "Procedure Notes", "Batch Production", "Cost per 1 batch"]
+    for i, department in enumerate(LABOR_DEPARTMENTS):
+        rows[labor_start + 1 + i][0:4] = [department, "", str(rng.randint(0, 90)), f"{rng.uniform(0, 400):.2f}"]
+    return rows
+
+def generate_station_sheet(num_recipes=100, num_ingredients=8, num_raw_materials=500,
+                           subrecipe_ratio=0.1, station="Synthetic", seed=0):
+    """All-string station DataFrame shaped like get_all_values output.
+
+    subrecipe_ratio of the ingredient lines reference an earlier recipe of the
+    same sheet, so multi-level explosion is exercised without cycles.
+    """
+    rng = random.Random(seed)
+    raw_materials = [f"RM {i:05d}" for i in range(num_raw_materials)]
+    recipe_names = [f"{station} Recipe {i:05d}" for i in range(num_recipes)]
+
+    rows = [["BOM", station] + [""] * (SHEET_COLUMNS - 2), [""] * SHEET_COLUMNS]
+    for i, name in enumerate(recipe_names):
+        ingredients = [
+            rng.choice(recipe_names[:i]) if i and rng.random() < subrecipe_ratio else rng.choice(raw_materials)
+            for _ in range(num_ingredients)
+        ]
+        rows.extend(_recipe_block(rng, name, f"SKU-{seed:02d}-{i:05d}", ingredients))
+    return pd.DataFrame(rows)
+
+def generate_station_data(stations, num_recipes=100, num_ingredients=8, **kwargs):
+    """{station: sheet} for several stations, each with its own recipe names"""
+    return {
+        station: generate_station_sheet(num_recipes, num_ingredients, station=station, seed=seed, **kwargs)
+        for seed, station in enumerate(stations)
+    }
@@ -0,0 +1,149 @@
+"""Background write queue for pack-size flags.
+
+Edits are merged per station and recipe for a short coalescing window and then
+written as one request each, retrying with exponential backoff while the API
+answers 429 or 5xx. Callers get a ticket back immediately and poll its status.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import METRICS, span
+
+WRITE_COALESCE_SECONDS = float(os.environ.get("BOM_WRITE_COALESCE_SECONDS", "0.5"))
+WRITE_MAX_ATTEMPTS = int(os.environ.get("BOM_WRITE_MAX_ATTEMPTS", "5"))
+WRITE_BACKOFF_SECONDS = float(os.environ.get("BOM_WRITE_BACKOFF_SECONDS", "1"))
+
+# How often a session polls its queued writes
+WRITE_STATUS_POLL_SECONDS = float(os.environ.get("BOM_WRITE_STATUS_POLL_SECONDS", "1"))
+
+# Finished tickets kept for status lookups
+WRITE_TICKET_HISTORY = 1000
+
+def is_retryable(error):
+    """True for rate limiting (429), server errors (5xx) and dropped connections"""
+    import requests
+
+    if isinstance(error, (ConnectionError, TimeoutError, requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout)):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+class PackSizeWriteQueue:
+    """Coalescing writer of {pack_size: available} changes on a daemon thread.
+
+    write(station, pack_rows, changes) performs one batched write, as
+    DataSource.write_pack_sizes; on_written, if given, is called with the same
+    arguments after a write succeeds (e.g. to patch the station cache). Every
+    submit returns a ticket whose state moves through pending, writing,
+    retrying and ends as done or failed.
+    """
+
+    def __init__(self, write, on_written=None, delay=WRITE_COALESCE_SECONDS,
+                 max_attempts=WRITE_MAX_ATTEMPTS, backoff=WRITE_BACKOFF_SECONDS):
+        self.write = write
+        self.on_written = on_written
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._first_pending_at = None
+        self._tickets = OrderedDict()
+        self._next_ticket = 1
+        self._active = 0
+        self._worker = None
+
+    def submit(self, station, recipe, pack_rows, changes):
+        """Queue changes for one recipe of a station and return their ticket"""
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._tickets[ticket] = {"state": "pending", "changes": dict(changes), "attempts": 0, "error": None}
+            batch = self._pending.setdefault((station, recipe), {"pack_rows": {}, "changes": {}, "tickets": []})
+            batch["pack_rows"].update(pack_rows)
+            batch["changes"].update(changes)
+            batch["tickets"].append(ticket)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.time()
+            self._trim_tickets()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="pack-size-writer", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+        METRICS.inc("pack_write_edits_total", len(changes))
+        return ticket
+
+    def status(self, ticket):
+        """Copy of a ticket's state, changes, attempts and last error; None once forgotten"""
+        with self._cond:
+            status = self._tickets.get(ticket)
+            return dict(status) if status is not None else None
+
+    def wait(self, timeout=None):
+        """Block until every queued edit is written or has failed; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._active, timeout)
+
+    def _trim_tickets(self):
+        finished = [ticket for ticket, status in self._tickets.items() if status["state"] in ("done", "failed")]
+        for ticket in finished[:max(0, len(self._tickets) - WRITE_TICKET_HISTORY)]:
+            del self._tickets[ticket]
+
+    def _set_state(self, tickets, **fields):
+        with self._cond:
+            for ticket in tickets:
+                if ticket in self._tickets:
+                    self._tickets[ticket].update(fields)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                # Let edits made in quick succession join the same request
+                deadline = self._first_pending_at + self.delay
+                while time.time() < deadline:
+                    self._cond.wait(deadline - time.time())
+                batches, self._pending, self._first_pending_at = self._pending, {}, None
+                self._active = len(batches)
+
+            for (station, recipe), batch in batches.items():
+                try:
+                    self._write_batch(station, batch)
+                finally:
+                    with self._cond:
+                        self._active -= 1
+                        self._cond.notify_all()
+
+    def _write_batch(self, station, batch):
+        tickets, pack_rows, changes = batch["tickets"], batch["pack_rows"], batch["changes"]
+        METRICS.inc("pack_write_coalesced_total", len(tickets) - 1)
+        for attempt in range(1, self.max_attempts + 1):
+            self._set_state(tickets, state="writing", attempts=attempt)
+            try:
+                with span("pack_write", station=station):
+                    self.write(station, pack_rows, changes)
+            except Exception as e:
+                if attempt < self.max_attempts and is_retryable(e):
+                    METRICS.inc("pack_write_retries_total", station=station)
+                    self._set_state(tickets, state="retrying", error=str(e))
+                    time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(1, 1.5))
+                    continue
+                METRICS.inc("pack_writes_total", station=station, status="failed")
+                self._set_state(tickets, state="failed", error=str(e))
+                return
+            if self.on_written:
+                try:
+                    self.on_written(station, pack_rows, changes)
+                except Exception:
+                    # The write landed; the next refresh of the station picks it up
+                    METRICS.inc("pack_write_callback_errors_total", station=station)
+            METRICS.inc("pack_writes_total", station=station, status="ok")
+            self._set_state(tickets, state="done", error=None)
+            return
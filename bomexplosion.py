@@ -1,12 +1,62 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 import warnings
 import io
+import os
+import time
+
+from bom import (
+    BOM_CACHE,
+    GoogleSheetsSource,
+    BOMCycleError,
+    BOMExplosion,
+    CostModel,
+    DEPARTMENTS,
+    LaborCapacity,
+    PackSizeWriteQueue,
+    SheetsSession,
+    SiteDataCache,
+    SnapshotStore,
+    StationDataCache,
+    WhereUsedIndex,
+    batch_sweep,
+    calculate_ingredients_with_batches,
+    calculate_specifications,
+    consolidated_ingredient_totals,
+    consolidated_recipes,
+    load_sites,
+    load_snapshot_frame,
+    parse_available_minutes,
+    read_price_table,
+    read_production_plan,
+)
+from bom.costing import PRICE_TABLE
+from bom.export import (
+    EXPORT_FORMATS,
+    RECIPE_DATASETS,
+    export_bytes,
+    export_file_name,
+    iter_plan_chunks,
+    recipe_datasets,
+)
+from bom.metrics import (
+    METRICS,
+    enable_json_logs,
+    observe_span,
+    span,
+    start_metrics_server,
+    start_trace,
+    stop_trace,
+    write_prometheus,
+)
+from bom.sheets import credentials_from_service_account_info
+from bom.writes import WRITE_STATUS_POLL_SECONDS
 
 warnings.filterwarnings('ignore')
 
+rerun_started = time.perf_counter()
+start_trace()
+
 st.set_page_config(page_title="BOM Explosion", layout="wide")
 
 # Custom CSS for exact UI design
@@ -293,6 +343,21 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def setup_metrics_exports():
+    """JSON span logs (BOM_METRICS_LOG=1) and a /metrics endpoint (BOM_METRICS_PORT), once per process"""
+    if os.environ.get("BOM_METRICS_LOG") == "1":
+        enable_json_logs()
+    if os.environ.get("BOM_METRICS_PORT"):
+        return start_metrics_server(int(os.environ["BOM_METRICS_PORT"]))
+    return None
+
+setup_metrics_exports()
+
+def show_dataframe(df, section):
+    with span("render", section=section):
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
 @st.cache_resource
 def load_credentials():
     try:
@@ -308,222 +373,436 @@ def load_credentials():
             "auth_provider_x509_cert_url": st.secrets["google_credentials"]["auth_provider_x509_cert_url"],
             "client_x509_cert_url": st.secrets["google_credentials"]["client_x509_cert_url"]
         }
-        scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        return Credentials.from_service_account_info(credentials_dict, scopes=scopes)
+        return credentials_from_service_account_info(credentials_dict)
     except Exception as e:
         st.error(f"Error loading credentials: {e}")
         return None
 
-@st.cache_data(ttl=60)
-def load_station_data(station):
+@st.cache_resource
+def get_sites():
+    """Configured sites (BOM_SITES), or the single site reading BOM_DATA_SOURCE"""
+    return {site.name: site for site in load_sites()}
+
+@st.cache_resource
+def get_sheets_session(site_name):
+    credentials = load_credentials()
+    if not credentials:
+        return None
+    site = get_sites()[site_name]
+    return SheetsSession(credentials, site.spreadsheet_key, site.stations)
+
+@st.cache_resource
+def get_snapshot_store():
+    return SnapshotStore()
+
+@st.cache_resource
+def get_data_source(site_name):
+    site = get_sites()[site_name]
+    if site.source.partition(":")[0] == "sheets":
+        return site.open_source(session=lambda: get_sheets_session(site_name), store=get_snapshot_store())
+    return site.open_source()
+
+def open_station_cache(site):
+    """A site's own station cache and refresher, so each site refreshes independently"""
+    load_snapshot = None
+    if isinstance(get_data_source(site.name), GoogleSheetsSource):
+        load_snapshot = lambda station: load_snapshot_frame(get_data_source(site.name).store, station,
+                                                            site.spreadsheet_key, site.stations)
+    cache = StationDataCache(fetch=lambda stations: get_data_source(site.name).fetch(stations),
+                             stations=site.station_names, load_snapshot=load_snapshot)
+    cache.start_refresher()
+    return cache
+
+@st.cache_resource
+def get_site_cache():
+    return SiteDataCache(get_sites().values(), open_station_cache)
+
+def load_station_data(site, station):
     try:
-        credentials = load_credentials()
-        if not credentials:
-            return None
+        return get_site_cache().get(site, station)
+    except Exception as e:
+        st.error(f"Error loading {site} / {station} data: {e}")
+        return None
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_batch_sweep(station, content_hash, recipe_name, max_batches, _bom_data):
+    """What-if table for 1..max_batches batches of one recipe, computed once per data load"""
+    return batch_sweep(_bom_data['recipe_yield'], _bom_data['final_net_output'],
+                       _bom_data['ingredients'], range(1, max_batches + 1))
+
+@st.cache_resource
+def get_pack_write_queue(site):
+    """One background writer per site for all sessions; successful writes are patched into its station cache"""
+    def patch_station_cache(station, pack_rows, changes):
+        get_site_cache().caches[site].patch(station, {pack_rows[size]: available for size, available in changes.items()})
+    
+    return PackSizeWriteQueue(
+        write=lambda station, pack_rows, changes: get_data_source(site).write_pack_sizes(station, pack_rows, changes),
+        on_written=patch_station_cache
+    )
+
+def queue_pack_size_changes(station_data, changes, site, station, recipe):
+    """Queue {pack_size: available} changes for one recipe and return the write ticket.
+
+    Target rows are located from the already-loaded station data, so no reads
+    are issued; the availability flag lives in column B of the pack row.
+    """
+    pack_rows = station_data.pack_rows(recipe)
+    missing = [size for size in changes if size not in pack_rows]
+    if missing:
+        st.error(f"Pack size not found in sheet: {', '.join(missing)}")
+        return None
+    return get_pack_write_queue(site).submit(station, recipe, pack_rows, changes)
+
+def load_recipe_indexes(site, stations=None):
+    """RecipeIndex for every station of a site that loaded, plus a key identifying their contents"""
+    indexes = {}
+    content_key = []
+    for station in stations or get_sites()[site].station_names:
+        station_data = load_station_data(site, station)
+        if station_data is None:
+            continue
+        indexes[station] = station_data.index
+        content_key.append((site, station, station_data.content_hash))
+    return indexes, tuple(content_key)
+
+@st.cache_resource(max_entries=4)
+def get_bom_explosion(content_key, _recipe_indexes):
+    return BOMExplosion(_recipe_indexes)
+
+@st.cache_resource(max_entries=4)
+def get_labor_capacity(content_key, _recipe_indexes):
+    return LaborCapacity(_recipe_indexes)
+
+@st.cache_resource
+def get_where_used_index(site):
+    """One where-used index per site for all sessions, reindexed per station as its data changes"""
+    return WhereUsedIndex()
+
+@st.fragment(run_every=WRITE_STATUS_POLL_SECONDS)
+def pack_write_status(site, station, selected_recipe):
+    """Progress of this session's queued pack-size writes; reruns the app once they have all finished"""
+    queue = get_pack_write_queue(site)
+    writes = st.session_state.get("pack_writes", {}).get(site, {})
+    in_flight = []
+    for (write_station, recipe, size), (_, ticket) in list(writes.items()):
+        status = queue.status(ticket)
+        if status is None or status["state"] == "done":
+            if (write_station, recipe) == (station, selected_recipe):
+                # Written and patched into the station cache: the rerun below shows the new data
+                del writes[(write_station, recipe, size)]
+        elif status["state"] != "failed":
+            in_flight.append((size, status))
+    
+    if not in_flight:
+        st.rerun()
+    retrying = [f"{size} (attempt {status['attempts']})" for size, status in in_flight if status["state"] == "retrying"]
+    if retrying:
+        st.caption(f"Sheets is busy, retrying {', '.join(retrying)}...")
+    else:
+        st.caption(f"Saving {', '.join(size for size, _ in in_flight)}...")
+
+def toggle_pack_size(site, station, recipe, size, checkbox_key, station_data):
+    """on_change of a pack-size checkbox: queue the new flag and show it until the sheet catches up"""
+    available = st.session_state[checkbox_key]
+    # Toggles made in quick succession, here or in other sessions, go out in one request
+    ticket = queue_pack_size_changes(station_data, {size: available}, site, station, recipe)
+    if ticket is not None:
+        st.session_state.setdefault("pack_writes", {}).setdefault(site, {})[(station, recipe, size)] = (available, ticket)
+
+@st.fragment
+def pack_sizes_section(site, station, selected_recipe, bom_data, station_data):
+    """Pack-size checkboxes; toggles are shown at once and written to the sheet in the background"""
+    # Pack sizes section (without container - simple title and checkboxes)
+    if bom_data['pack_sizes']:
+        st.markdown('<h3 class="pack-sizes-title">PACK SIZES</h3>', unsafe_allow_html=True)
         
-        gc = gspread.authorize(credentials)
-        sh = gc.open_by_key("17jeWWOaREFg6QMqDpQX-T3LYsETR7F4iZvWS5lC0I3w")
+        # Optimistic state per site: {(station, recipe, size): (available, ticket)} until the sheet data catches up
+        writes = st.session_state.setdefault("pack_writes", {}).setdefault(site, {})
+        queue = get_pack_write_queue(site)
+        packs = {pack['size']: pack['available'] for pack in bom_data['pack_sizes']}
+        failed = []
+        for write_key in [key for key in writes if key[:2] == (station, selected_recipe)]:
+            available, ticket = writes[write_key]
+            status = queue.status(ticket)
+            if status is not None and status["state"] == "failed":
+                # Back to the sheet's value: drop the checkbox state so it re-initialises
+                del writes[write_key]
+                st.session_state.pop(f"pack_{selected_recipe}_{write_key[2]}_checkbox", None)
+                failed.append(f"{write_key[2]}: {status['error']}")
+            elif (status is None or status["state"] == "done") and packs.get(write_key[2]) == available:
+                del writes[write_key]
+        if failed:
+            st.error(f"Failed to update {'; '.join(failed)}")
+            # The sheet may have changed under this data (e.g. rows inserted): fetch it again
+            get_site_cache().caches[site].revalidate_async([station])
         
-        # Map station to worksheet index
-        station_sheet_map = {
-            "Butchery": 2,
-            "Hot Kitchen": 3,
-            "Cold Kitchen": 4,
-            "Pastry": 5
-        }
+        pack_cols = st.columns(len(bom_data['pack_sizes']))
+        for i, pack in enumerate(bom_data['pack_sizes']):
+            with pack_cols[i]:
+                checkbox_key = f"pack_{selected_recipe}_{pack['size']}_checkbox"
+                shown = writes.get((station, selected_recipe, pack['size']), (pack['available'],))[0]
+                if st.session_state.get(checkbox_key, shown) != shown:
+                    # The sheet changed under the checkbox (another session or the sheet itself): show its value
+                    del st.session_state[checkbox_key]
+                st.checkbox(pack['size'], value=shown, key=checkbox_key, on_change=toggle_pack_size,
+                            args=(site, station, selected_recipe, pack['size'], checkbox_key, station_data))
         
-        sheet_index = station_sheet_map.get(station, 4)
-        worksheet = sh.get_worksheet(sheet_index)
-        data = worksheet.get_all_values()
-        df = pd.DataFrame(data)
-        return df
-    except Exception as e:
-        st.error(f"Error loading {station} data: {e}")
-        return None
+        if any(key[:2] == (station, selected_recipe) for key in writes):
+            pack_write_status(site, station, selected_recipe)
 
-def get_subrecipes(df):
-    subrecipes = []
-    for idx, row in df.iterrows():
-        col_a_value = str(row.iloc[0]).strip().upper()
-        if "INTERNAL NAME" in col_a_value:
-            name = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else f"Recipe_{idx}"
-            subrecipes.append({'name': name, 'row': idx})
-    return subrecipes
+@st.fragment
+def batch_what_if(station, content_hash, selected_recipe, bom_data):
+    """Specifications and ingredient BATCH QTY for a whole range of batch counts"""
+    with st.expander("BATCH WHAT-IF"):
+        max_batches = st.number_input("Compare batch counts up to", min_value=2, max_value=200, value=10, step=1, key="sweep_max_batches")
+        batch_table = get_batch_sweep(station, content_hash, selected_recipe, int(max_batches), bom_data)
+        show_dataframe(batch_table, "batch_sweep")
 
-def update_pack_size_in_sheet(recipe_row, pack_size, new_state, station):
-    try:
-        credentials = load_credentials()
-        if not credentials:
-            return False
+@st.fragment
+def recipe_calculations(site, station, selected_recipe, bom_data, station_data, explosion):
+    """Specifications, recipe inputs, ingredients and exploded BOM.
+
+    A batch change reruns only this fragment: no data loading, parsing or page CSS.
+    explosion is the site's BOMExplosion, resolved by the full run.
+    """
+    with span("fragment_rerun", fragment="recipe_calculations"):
+        # Specifications section
+        st.markdown('''
+        <div class="section-container">
+            <div class="section-header">SPECIFICATIONS</div>
+            <div class="section-content">
+        ''', unsafe_allow_html=True)
         
-        gc = gspread.authorize(credentials)
-        sh = gc.open_by_key("17jeWWOaREFg6QMqDpQX-T3LYsETR7F4iZvWS5lC0I3w")
+        # Show specifications first (will be updated later with calculated values)
+        specs_placeholder = st.empty()
         
-        # Map station to worksheet index
-        station_sheet_map = {
-            "Butchery": 2,
-            "Hot Kitchen": 3,
-            "Cold Kitchen": 4,
-            "Pastry": 1
-        }
+        st.markdown('</div></div>', unsafe_allow_html=True)
         
-        sheet_index = station_sheet_map.get(station, 4)
-        worksheet = sh.get_worksheet(sheet_index)
+        # Recipe Information section (now interactive and below specifications)
+        st.markdown('''
+        <div class="section-container">
+            <div class="section-header">RECIPE INFORMATION</div>
+            <div class="section-content" style="padding: 20px;">
+        ''', unsafe_allow_html=True)
         
-        section_start = recipe_row + 1
-        section_end = recipe_row + 24
+        # Interactive recipe inputs
+        recipe_col1, recipe_col2 = st.columns([2, 2])
         
-        for row_idx in range(section_start, section_end):
-            try:
-                row_data = worksheet.row_values(row_idx)
-                if len(row_data) >= 3:
-                    col_c = row_data[2] if len(row_data) > 2 else ""
-                    if col_c == pack_size:
-                        worksheet.update_cell(row_idx, 2, "TRUE" if new_state else "FALSE")
-                        return True
-            except:
-                continue
+        with recipe_col2:
+            st.markdown("**Recipe (# of Batches):**")
+            num_batches = st.number_input("", min_value=1, value=int(bom_data['recipe_batches']) if bom_data['recipe_batches'] else 1, step=1, key="batches_input")
         
-        return False
-    except Exception as e:
-        st.error(f"Error updating sheet: {e}")
-        return False
-
-def extract_bom_data(df, start_row):
-    section = df.iloc[start_row:start_row+24]
-    
-    internal_name = str(section.iloc[0, 1]) if pd.notna(section.iloc[0, 1]) else ""
-    sku_code = str(section.iloc[1, 1]) if pd.notna(section.iloc[1, 1]) else ""
-    
-    specs_data = []
-    pack_sizes = []
-    final_net_output = ""
-    
-    for idx, row in section.iterrows():
-        col_a = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
-        col_b = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
-        col_c = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ""
+        with recipe_col1:
+            st.markdown("**Recipe Yield (Unportioned):**")
+            calculated_recipe_yield = bom_data['recipe_yield'] * num_batches if bom_data['recipe_yield'] else 0
+            st.text(f"{calculated_recipe_yield:.2f} L")
         
-        if col_a in ["Standard Batch Size"]:
-            specs_data.append({"SPECIFICATIONS": col_a, "Value": col_b, "UOM": col_c})
-        elif col_a == "Final Net Output (yielded weight)":
-            final_net_output = col_b
+        st.markdown('</div></div>', unsafe_allow_html=True)
         
-        elif col_a == "Pack Size" or (col_a == "" and col_b in ["TRUE", "FALSE"] and col_c in ["500g", "1000g", "2000g", "5000g"]):
-            if col_b in ["TRUE", "FALSE"] and col_c:
-                pack_sizes.append({
-                    "size": col_c,
-                    "available": col_b == "TRUE"
-                })
-    
-    # Get base recipe yield and batches
-    recipe_yield = ""
-    recipe_batches = ""
-    for idx, row in section.iterrows():
-        if len(row) > 6:
-            col_f = str(row.iloc[5]).strip() if pd.notna(row.iloc[5]) else ""
-            col_g = str(row.iloc[6]).strip() if pd.notna(row.iloc[6]) else ""
-            if col_f and col_g and col_f != "RECIPE YIELD (Unportioned)":
-                try:
-                    float(col_f)
-                    recipe_yield = col_f
-                    recipe_batches = col_g
-                    break
-                except:
-                    pass
-    
-    # Get ingredients data
-    ingredients_data = []
-    for idx, row in section.iterrows():
-        if len(row) > 9:
-            qty = str(row.iloc[7]).strip() if pd.notna(row.iloc[7]) else ""
-            batch_qty = str(row.iloc[8]).strip() if pd.notna(row.iloc[8]) else ""
-            ingredient_name = str(row.iloc[9]).strip() if pd.notna(row.iloc[9]) else ""
-            
-            if qty and batch_qty and ingredient_name and ingredient_name != "INTERNAL NAME":
-                try:
-                    float(qty)
-                    ingredients_data.append({
-                        "QTY": qty,
-                        "BATCH QTY": batch_qty,
-                        "INTERNAL NAME": ingredient_name
-                    })
-                except:
-                    pass
-    
-    ingredients_df = pd.DataFrame(ingredients_data)
-    
-    labor_data = []
-    labor_departments = ["Dry Product Scaling", "Vegetable Production", "Butchery", 
-                        "Cold Kitchen", "Hot Kitchen", "Pastry Kitchen", "Packaging", "TOTAL"]
-    
-    for idx, row in section.iterrows():
-        col_a = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
-        if col_a in labor_departments:
-            notes = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
-            batch_production = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ""
-            cost = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else ""
-            labor_data.append({
-                "LABOR PRODUCTIVITY (minutes)": col_a,
-                "Procedure Notes": notes,
-                "Batch Production": batch_production,
-                "Cost per 1 batch": cost
-            })
-    
-    labor_df = pd.DataFrame(labor_data)
-    
-    return {
-        "internal_name": internal_name,
-        "sku_code": sku_code,
-        "base_specs": specs_data,
-        "recipe_yield": recipe_yield,
-        "recipe_batches": recipe_batches,
-        "final_net_output": final_net_output,
-        "ingredients": ingredients_df,
-        "labor_productivity": labor_df,
-        "pack_sizes": pack_sizes
-    }
-
-def calculate_specifications(recipe_yield, num_batches, final_net_output):
-    """Calculate specifications where theoretical total = recipe yield * batches"""
-    try:
-        yield_val = float(recipe_yield) if recipe_yield else 0
-        batches = float(num_batches) if num_batches else 1
-        final_output = float(final_net_output) if final_net_output else 0
+        # Calculate dynamic specifications
+        calculated_recipe_yield, theoretical_total, final_net_output, processing_loss, processing_loss_pct = calculate_specifications(
+            bom_data['recipe_yield'], num_batches, bom_data['final_net_output']
+        )
+        
+        # Build dynamic specifications dataframe
+        dynamic_specs = []
+        for spec, value, uom in bom_data['base_specs']:
+            dynamic_specs.append({"SPECIFICATIONS": spec, "Value": value, "UOM": uom})
+        
+        # Add calculated specifications
+        dynamic_specs.extend([
+            {"SPECIFICATIONS": "Theoretical Total", "Value": f"{theoretical_total:.2f}", "UOM": "L"},
+            {"SPECIFICATIONS": "Final Net Output (yielded weight)", "Value": f"{final_net_output:.2f}", "UOM": "L"},
+            {"SPECIFICATIONS": "Processing Loss", "Value": f"{processing_loss:.2f}", "UOM": "L"},
+            {"SPECIFICATIONS": "Processing Loss %", "Value": f"{processing_loss_pct:.1f}%", "UOM": ""}
+        ])
+        
+        specs_df = pd.DataFrame(dynamic_specs)
         
-        # Recipe Yield (Unportioned) in app = original recipe yield * batches
-        calculated_recipe_yield = yield_val * batches
+        # Update specifications with calculated values
+        with specs_placeholder:
+            show_dataframe(specs_df, "specifications")
         
-        # Theoretical Total = Recipe Yield (Unportioned) from the app
-        theoretical_total = calculated_recipe_yield
+        pack_sizes_section(site, station, selected_recipe, bom_data, station_data)
         
-        processing_loss = theoretical_total - final_output
-        processing_loss_pct = (processing_loss / theoretical_total * 100) if theoretical_total > 0 else 0
+        # Ingredients section (with calculated quantities)
+        calculated_ingredients = calculate_ingredients_with_batches(bom_data['ingredients'], num_batches)
         
-        return calculated_recipe_yield, theoretical_total, final_output, processing_loss, processing_loss_pct
-    except:
-        return 0, 0, 0, 0, 0
+        st.markdown('''
+        <div class="section-container">
+            <div class="section-header">INGREDIENTS</div>
+            <div class="section-content">
+        ''', unsafe_allow_html=True)
+        
+        show_dataframe(calculated_ingredients, "ingredients")
+        
+        st.markdown('</div></div>', unsafe_allow_html=True)
+        
+        batch_what_if(station, station_data.content_hash, selected_recipe, bom_data)
+        
+        # Exploded BOM section (sub-recipes expanded down to raw materials)
+        st.markdown('''
+        <div class="section-container">
+            <div class="section-header">EXPLODED BOM (RAW MATERIALS)</div>
+            <div class="section-content">
+        ''', unsafe_allow_html=True)
+        
+        try:
+            exploded_bom = explosion.explode(selected_recipe, num_batches)
+            show_dataframe(exploded_bom, "exploded_bom")
+        except BOMCycleError as e:
+            st.error(str(e))
+        
+        st.markdown('</div></div>', unsafe_allow_html=True)
 
-def calculate_ingredients_with_batches(ingredients_df, num_batches):
-    """QTY stays the same, BATCH QTY = QTY * num_batches"""
-    if ingredients_df.empty:
-        return ingredients_df
-    
-    try:
-        batches = float(num_batches) if num_batches else 1
-        updated_df = ingredients_df.copy()
+@st.fragment
+def production_plan_explosion(recipe_indexes, content_key):
+    """Many recipes x batches in one pass; an upload reruns only this fragment"""
+    with st.expander("PRODUCTION PLAN EXPLOSION"):
+        plan_file = st.file_uploader("Production plan (CSV/XLSX with RECIPE and BATCHES columns)", type=["csv", "xlsx"], key="plan_upload")
+        if plan_file is not None:
+            try:
+                plan_df = read_production_plan(plan_file)
+                plan_explosion = get_bom_explosion(content_key, recipe_indexes)
+                pick_list, unknown_recipes = plan_explosion.explode_plan(plan_df)
+                
+                if unknown_recipes:
+                    st.warning(f"Recipes not found: {', '.join(unknown_recipes)}")
+                
+                show_dataframe(pick_list, "pick_list")
+                st.download_button("Download pick list", pick_list.to_csv(index=False).encode("utf-8"),
+                                   file_name="pick_list.csv", mime="text/csv")
+                st.download_button("Download full plan explosion",
+                                   lambda: export_bytes({"plan_explosion": iter_plan_chunks(plan_explosion, plan_df)}, "csv"),
+                                   file_name="plan_explosion.csv", mime="text/csv")
+                
+                # Labor capacity: planned minutes per department against available staff-minutes
+                st.markdown("**Labor capacity**")
+                configured_minutes = parse_available_minutes()
+                available_df = st.data_editor(
+                    pd.DataFrame({"DEPARTMENT": DEPARTMENTS,
+                                  "AVAILABLE MINUTES": [configured_minutes.get(d) for d in DEPARTMENTS]}),
+                    disabled=["DEPARTMENT"], hide_index=True, key="available_minutes_editor"
+                )
+                available_minutes = available_df.dropna().set_index("DEPARTMENT")["AVAILABLE MINUTES"].to_dict()
+                capacity, _ = get_labor_capacity(content_key, recipe_indexes).rollup(plan_df, available_minutes)
+                over_capacity = capacity.loc[capacity['OVER CAPACITY'], 'DEPARTMENT'].tolist()
+                if over_capacity:
+                    st.warning(f"Over capacity: {', '.join(over_capacity)}")
+                show_dataframe(capacity, "labor_capacity")
+            except BOMCycleError as e:
+                st.error(str(e))
+            except Exception as e:
+                st.error(f"Error reading production plan: {e}")
+
+@st.cache_data(show_spinner=False)
+def load_default_prices():
+    """Price table at BOM_PRICE_TABLE, if configured"""
+    if not PRICE_TABLE:
+        return None
+    with open(PRICE_TABLE, "rb") as price_file:
+        return read_price_table(price_file)
+
+@st.fragment
+def recipe_costing(recipe_indexes, content_key, selected_recipe):
+    """Recipe and pack-size costs; editing a price re-costs only the recipes that depend on it"""
+    with st.expander("COSTING"):
+        price_file = st.file_uploader("Price table (CSV/XLSX with INTERNAL NAME and PRICE columns)", type=["csv", "xlsx"], key="price_upload")
+        try:
+            prices = read_price_table(price_file) if price_file is not None else load_default_prices()
+        except Exception as e:
+            st.error(f"Error reading price table: {e}")
+            return
         
-        # QTY column remains unchanged
-        # BATCH QTY = QTY * number of batches
-        updated_df['BATCH QTY'] = updated_df['QTY'].astype(float) * batches
-        updated_df['BATCH QTY'] = updated_df['BATCH QTY'].round(3)
+        # One model per session and data load; price edits update it in place
+        model_key = (content_key, price_file.file_id if price_file is not None else PRICE_TABLE)
+        cached = st.session_state.get("cost_model")
+        if cached is None or cached[0] != model_key:
+            model = CostModel(get_bom_explosion(content_key, recipe_indexes),
+                              get_labor_capacity(content_key, recipe_indexes), prices)
+            cached = st.session_state["cost_model"] = (model_key, model, model.price_table())
+        _, model, base_prices = cached
         
-        # Keep original column order
-        updated_df = updated_df[['QTY', 'BATCH QTY', 'INTERNAL NAME']]
+        edited_prices = st.data_editor(base_prices, disabled=["INTERNAL NAME"], hide_index=True,
+                                       key=f"price_editor_{abs(hash(model_key))}")
+        recosted = model.set_prices(edited_prices.set_index("INTERNAL NAME")["PRICE"].to_dict())
+        if recosted:
+            st.caption(f"Re-costed {len(recosted)} of {len(model.order)} recipes")
         
-        return updated_df
-    except:
-        return ingredients_df
+        try:
+            recipe_cost = pd.DataFrame([model.recipe_cost(selected_recipe)])
+            st.markdown(f"**{selected_recipe}**")
+            show_dataframe(recipe_cost, "recipe_cost")
+            show_dataframe(model.pack_costs(selected_recipe), "pack_costs")
+        except KeyError:
+            pass  # no recipe of this site selected
+        except BOMCycleError as e:
+            st.error(str(e))
+        
+        st.markdown("**All recipes**")
+        show_dataframe(model.costs(), "costs")
+
+@st.fragment
+def bulk_export(recipe_indexes):
+    """Every recipe's specs, ingredients, labor and pack sizes as one download, streamed chunk by chunk"""
+    with st.expander("BULK EXPORT"):
+        export_format = st.selectbox("Format", EXPORT_FORMATS, key="export_format")
+        export_names = st.multiselect("Datasets", RECIPE_DATASETS, default=RECIPE_DATASETS, key="export_datasets")
+        if export_names:
+            st.download_button("Download export",
+                               lambda: export_bytes(recipe_datasets(recipe_indexes, export_names), export_format),
+                               file_name=export_file_name(export_names, export_format))
+
+@st.fragment
+def where_used_search(site, recipe_indexes):
+    """Name search over every station and where-used lookup for the chosen ingredient"""
+    with st.expander("WHERE USED / SEARCH"):
+        where_used = get_where_used_index(site)
+        for indexed_station, index in recipe_indexes.items():
+            where_used.update(indexed_station, index)
+        
+        query = st.text_input("Search recipes and ingredients", key="where_used_query")
+        if query:
+            matches = where_used.search(query)
+            show_dataframe(matches, "search")
+            
+            if not matches.empty:
+                ingredient = st.selectbox("Where used", matches['NAME'].unique().tolist(), key="where_used_ingredient")
+                indirect = st.checkbox("Include recipes using it through sub-recipes", key="where_used_indirect")
+                used_by = where_used.where_used(ingredient, indirect=indirect)
+                st.caption(f"{used_by['RECIPE'].nunique()} recipes use {ingredient}")
+                show_dataframe(used_by, "where_used")
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_consolidated_ingredient_totals(content_key, _site_indexes):
+    """Exploded ingredient totals of every site, computed once per data load"""
+    return consolidated_ingredient_totals(_site_indexes)
+
+@st.fragment
+def consolidated_sites():
+    """Recipes and ingredient totals across every site; sites load in parallel and a slow one is skipped"""
+    with st.expander("ALL SITES"):
+        site_cache = get_site_cache()
+        site_data, problems = site_cache.load_all()
+        for problem_site, problem in problems.items():
+            st.warning(f"{problem_site}: {problem}")
+        
+        site_indexes = {
+            data_site: {data_station: station_data.index for data_station, station_data in stations_data.items()}
+            for data_site, stations_data in site_data.items()
+        }
+        content_key = tuple((data_site, data_station, station_data.content_hash)
+                            for data_site, stations_data in site_data.items()
+                            for data_station, station_data in stations_data.items())
+        view = st.radio("View", ["Recipes", "Ingredient totals"], horizontal=True, key="consolidated_view")
+        if view == "Recipes":
+            show_dataframe(consolidated_recipes(site_indexes), "consolidated_recipes")
+        else:
+            try:
+                show_dataframe(get_consolidated_ingredient_totals(content_key, site_indexes), "consolidated_ingredients")
+            except BOMCycleError as e:
+                st.error(str(e))
 
 # Load data first to get recipe names - BUT DON'T USE IT YET
 # We'll reload after station selection
@@ -541,21 +820,29 @@ with nav_col1:
 
 with nav_col2:
     st.markdown('<div class="nav-selectors">', unsafe_allow_html=True)
-    station = st.selectbox("Station", ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"], key="station_selector")
+    sites = get_sites()
+    if len(sites) > 1:
+        site = st.selectbox("Site", list(sites), key="site_selector")
+    else:
+        site = next(iter(sites))
+    site_stations = sites[site].station_names
+    station = st.selectbox("Station", site_stations, key="station_selector")
     st.markdown('</div>', unsafe_allow_html=True)
 
 # NOW load data based on selected station
-if station in ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"]:
-    df = load_station_data(station)
-    if df is not None:
-        subrecipes = get_subrecipes(df)
-        recipe_names = [r['name'] for r in subrecipes] if subrecipes else []
+if station in site_stations:
+    station_data = load_station_data(site, station)
+    if station_data is not None:
+        recipe_index = station_data.index
+        recipe_names = recipe_index.names
     else:
         recipe_names = []
-        df = None
 else:
     recipe_names = []
-    df = None
+    station_data = None
+
+# Every station of the site, resolved once per full run and handed to the fragments below
+recipe_indexes, content_key = load_recipe_indexes(site)
 
 with nav_col3:
     st.markdown('<div class="nav-selectors">', unsafe_allow_html=True)
@@ -569,16 +856,16 @@ st.markdown('</div>', unsafe_allow_html=True)
 
 # Breadcrumb navigation
 if selected_recipe and selected_recipe != "No recipes available":
+    site_crumb = f'<a href="#">{site}</a> / ' if len(sites) > 1 else ''
     st.markdown(f'''
     <div class="breadcrumb">
-        <a href="#">Home</a> / <a href="#">{station}</a> / {selected_recipe}
+        <a href="#">Home</a> / {site_crumb}<a href="#">{station}</a> / {selected_recipe}
     </div>
     ''', unsafe_allow_html=True)
 
 # Main content
-if station in ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"] and selected_recipe and selected_recipe != "No recipes available" and df is not None:
-    selected_row = next(r['row'] for r in subrecipes if r['name'] == selected_recipe)
-    bom_data = extract_bom_data(df, selected_row)
+if station in site_stations and selected_recipe and selected_recipe != "No recipes available" and station_data is not None:
+    bom_data = recipe_index.boms[selected_recipe]
     
     # Page header using columns: Recipe Name + SKU
     st.markdown('<div style="margin: 30px 0 20px 0;">', unsafe_allow_html=True)
@@ -596,96 +883,8 @@ if station in ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"] and selected
     # Add the yellow line separator
     st.markdown('<div style="border-bottom: 3px solid #F4C430; margin: 0 0 30px 0;"></div>', unsafe_allow_html=True)
     
-    # Specifications section
-    st.markdown('''
-    <div class="section-container">
-        <div class="section-header">SPECIFICATIONS</div>
-        <div class="section-content">
-    ''', unsafe_allow_html=True)
-    
-    # Show specifications first (will be updated later with calculated values)
-    specs_placeholder = st.empty()
-    
-    st.markdown('</div></div>', unsafe_allow_html=True)
-    
-    # Recipe Information section (now interactive and below specifications)
-    st.markdown('''
-    <div class="section-container">
-        <div class="section-header">RECIPE INFORMATION</div>
-        <div class="section-content" style="padding: 20px;">
-    ''', unsafe_allow_html=True)
-    
-    # Interactive recipe inputs
-    recipe_col1, recipe_col2 = st.columns([2, 2])
-    
-    with recipe_col2:
-        st.markdown("**Recipe (# of Batches):**")
-        num_batches = st.number_input("", min_value=1, value=int(float(bom_data['recipe_batches'])) if bom_data['recipe_batches'] else 1, step=1, key="batches_input")
-    
-    with recipe_col1:
-        st.markdown("**Recipe Yield (Unportioned):**")
-        calculated_recipe_yield = float(bom_data['recipe_yield']) * num_batches if bom_data['recipe_yield'] else 0
-        st.text(f"{calculated_recipe_yield:.2f} L")
-    
-    st.markdown('</div></div>', unsafe_allow_html=True)
-    
-    # Calculate dynamic specifications
-    calculated_recipe_yield, theoretical_total, final_net_output, processing_loss, processing_loss_pct = calculate_specifications(
-        bom_data['recipe_yield'], num_batches, bom_data['final_net_output']
-    )
-    
-    # Build dynamic specifications dataframe
-    dynamic_specs = []
-    for spec in bom_data['base_specs']:
-        dynamic_specs.append(spec)
-    
-    # Add calculated specifications
-    dynamic_specs.extend([
-        {"SPECIFICATIONS": "Theoretical Total", "Value": f"{theoretical_total:.2f}", "UOM": "L"},
-        {"SPECIFICATIONS": "Final Net Output (yielded weight)", "Value": f"{final_net_output:.2f}", "UOM": "L"},
-        {"SPECIFICATIONS": "Processing Loss", "Value": f"{processing_loss:.2f}", "UOM": "L"},
-        {"SPECIFICATIONS": "Processing Loss %", "Value": f"{processing_loss_pct:.1f}%", "UOM": ""}
-    ])
-    
-    specs_df = pd.DataFrame(dynamic_specs)
-    
-    # Update specifications with calculated values
-    with specs_placeholder:
-        st.dataframe(specs_df, use_container_width=True, hide_index=True)
-    
-    # Pack sizes section (without container - simple title and checkboxes)
-    if bom_data['pack_sizes']:
-        st.markdown('<h3 class="pack-sizes-title">PACK SIZES</h3>', unsafe_allow_html=True)
-        
-        pack_cols = st.columns(len(bom_data['pack_sizes']))
-        for i, pack in enumerate(bom_data['pack_sizes']):
-            with pack_cols[i]:
-                checkbox_key = f"pack_{selected_recipe}_{pack['size']}_checkbox"
-                new_state = st.checkbox(pack['size'], value=pack['available'], key=checkbox_key)
-                
-                if new_state != pack['available']:
-                    with st.spinner(f"Updating {pack['size']}..."):
-                        success = update_pack_size_in_sheet(selected_row, pack['size'], new_state, station)
-                        if success:
-                            st.success(f"{pack['size']} updated!")
-                            st.cache_data.clear()
-                            st.rerun()
-                        else:
-                            st.error(f"Failed to update {pack['size']}")
-                            st.rerun()
-    
-    # Ingredients section (with calculated quantities)
-    calculated_ingredients = calculate_ingredients_with_batches(bom_data['ingredients'], num_batches)
-    
-    st.markdown('''
-    <div class="section-container">
-        <div class="section-header">INGREDIENTS</div>
-        <div class="section-content">
-    ''', unsafe_allow_html=True)
-    
-    st.dataframe(calculated_ingredients, use_container_width=True, hide_index=True)
-    
-    st.markdown('</div></div>', unsafe_allow_html=True)
+    recipe_calculations(site, station, selected_recipe, bom_data, station_data,
+                        get_bom_explosion(content_key, recipe_indexes))
     
     # Labor productivity section
     st.markdown('''
@@ -694,11 +893,39 @@ if station in ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"] and selected
         <div class="section-content">
     ''', unsafe_allow_html=True)
     
-    st.dataframe(bom_data['labor_productivity'], use_container_width=True, hide_index=True)
+    show_dataframe(bom_data['labor_productivity'], "labor")
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
-elif station not in ["Cold Kitchen", "Hot Kitchen", "Butchery", "Pastry"]:
+elif station not in site_stations:
     st.info(f"{station} not yet implemented")
 elif not selected_recipe or selected_recipe == "No recipes available":
     st.warning("No subrecipes found in the data")
+
+production_plan_explosion(recipe_indexes, content_key)
+
+recipe_costing(recipe_indexes, content_key, selected_recipe)
+
+where_used_search(site, recipe_indexes)
+
+bulk_export(recipe_indexes)
+
+if len(sites) > 1:
+    consolidated_sites()
+
+# Instrumentation: total rerun time, optional debug panel and metrics file dump
+observe_span("script_rerun", time.perf_counter() - rerun_started)
+rerun_trace = stop_trace()
+
+if os.environ.get("BOM_DEBUG") == "1" or st.query_params.get("debug") == "1":
+    with st.expander("DEBUG: TIMINGS"):
+        st.markdown("**This rerun**")
+        st.dataframe(pd.DataFrame(rerun_trace), use_container_width=True, hide_index=True)
+        st.markdown("**Process totals**")
+        st.dataframe(pd.DataFrame(METRICS.span_summary()), use_container_width=True, hide_index=True)
+        st.dataframe(pd.DataFrame(METRICS.counters()), use_container_width=True, hide_index=True)
+        st.markdown("**Parsed BOM cache**")
+        st.dataframe(pd.DataFrame([BOM_CACHE.stats()]), use_container_width=True, hide_index=True)
+
+if os.environ.get("BOM_METRICS_FILE"):
+    write_prometheus(os.environ["BOM_METRICS_FILE"])
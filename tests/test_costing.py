@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+from bom.costing import CostModel
+from bom.explosion import BOMCycleError, BOMExplosion
+from bom.labor import LaborCapacity
+from bom.parsing import RecipeIndex
+
+def _sheet(recipes):
+    """Station sheet of {name: (output per batch, Hot Kitchen labor cost, [(ingredient, qty)])} in the real block layout"""
+    rows = []
+    for i, (name, (output, labor_cost, ingredients)) in enumerate(recipes.items()):
+        block = [[""] * 12 for _ in range(max(len(ingredients) + 1, 4))]
+        block[0][0:2] = ["INTERNAL NAME", name]
+        block[1][0:2] = ["SKU", f"SKU{i:03d}"]
+        block[2][0:2] = ["Final Net Output (yielded weight)", str(output)]
+        block[3][0:4] = ["Hot Kitchen", "", "30", str(labor_cost)]
+        block[0][5:10] = ["RECIPE YIELD (Unportioned)", "RECIPE (# of Batches)", "QTY", "BATCH QTY", "INTERNAL NAME"]
+        block[1][5:7] = [str(output), "1"]
+        for line, (ingredient, qty) in enumerate(ingredients, start=1):
+            block[line][7:10] = [str(qty), str(qty), ingredient]
+        rows.extend(block)
+    return pd.DataFrame(rows)
+
+def _model(recipes, prices):
+    indexes = {"Hot Kitchen": RecipeIndex(_sheet(recipes))}
+    return CostModel(BOMExplosion(indexes), LaborCapacity(indexes), prices)
+
+KITCHEN = {
+    "Base": (5, 5, [("Stock", 10)]),
+    "Soup": (10, 0, [("Base", 2), ("Leek", 3)]),
+    "Stew": (8, 8, [("Soup", 4), ("Beef", 2)]),
+    "Bread": (4, 0, [("Flour", 2)])
+}
+PRICES = {"Stock": 1, "Leek": 2, "Beef": 10, "Flour": 3}
+
+def _unit_costs(model):
+    return {name: model.recipe_cost(name)["UNIT COST"] for name in KITCHEN}
+
+def test_costs_roll_up_through_sub_recipes():
+    model = _model(KITCHEN, PRICES)
+    # Base 10 x 1 + labor 5 over 5; Soup 2 Base + 3 x 2 over 10; Stew 4 Soup + 2 x 10 + labor 8 over 8
+    assert _unit_costs(model) == pytest.approx({"Base": 3, "Soup": 1.2, "Stew": 4.1, "Bread": 1.5})
+    assert model.recipe_cost("Stew")["INGREDIENT COST"] == pytest.approx(24.8)
+    assert model.recipe_cost("Stew")["BATCH COST"] == pytest.approx(32.8)
+
+    unpriced = _model(KITCHEN, {"Stock": 1, "Leek": 2, "Flour": 3})
+    assert unpriced.recipe_cost("Stew")["UNPRICED LINES"] == 1
+    assert unpriced.recipe_cost("Soup")["UNPRICED LINES"] == 0
+
+def test_price_change_recosts_only_reverse_dependencies():
+    model = _model(KITCHEN, PRICES)
+    recosted = model.set_prices({"Stock": 2})
+    # In dependency order, and Bread doesn't use Stock
+    assert recosted == ["BASE", "SOUP", "STEW"]
+    assert _unit_costs(model) == pytest.approx({"Base": 5, "Soup": 1.6, "Stew": 4.3, "Bread": 1.5})
+    assert _unit_costs(model) == pytest.approx(_unit_costs(_model(KITCHEN, dict(PRICES, Stock=2))))
+
+    assert model.set_prices({"Stock": 2}) == []
+    assert model.set_prices(pd.DataFrame({"INTERNAL NAME": ["flour "], "PRICE": [6.0]})) == ["BREAD"]
+    assert model.recipe_cost("Bread")["UNIT COST"] == pytest.approx(3)
+
+def test_recipes_in_or_using_a_cycle_are_not_costed():
+    model = _model(dict(KITCHEN, Gravy=(2, 0, [("Roux", 1)]), Roux=(2, 0, [("Gravy", 1)]),
+                        Pie=(4, 0, [("Gravy", 1), ("Flour", 1)])), PRICES)
+    for name in ("Gravy", "Roux", "Pie"):
+        with pytest.raises(BOMCycleError, match="Sub-recipe cycle"):
+            model.recipe_cost(name)
+    assert sorted(model.costs()["RECIPE"]) == sorted(KITCHEN)
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from bom.explosion import BOMCycleError, BOMExplosion
+from bom.parsing import RecipeIndex
+
+def _sheet(recipes):
+    """Station sheet of {name: (output per batch, [(ingredient, qty per batch)])} in the real block layout"""
+    rows = []
+    for i, (name, (output, ingredients)) in enumerate(recipes.items()):
+        block = [[""] * 12 for _ in range(max(len(ingredients) + 1, 3))]
+        block[0][0:2] = ["INTERNAL NAME", name]
+        block[1][0:2] = ["SKU", f"SKU{i:03d}"]
+        block[2][0:2] = ["Final Net Output (yielded weight)", str(output)]
+        block[0][5:10] = ["RECIPE YIELD (Unportioned)", "RECIPE (# of Batches)", "QTY", "BATCH QTY", "INTERNAL NAME"]
+        block[1][5:7] = [str(output), "1"]
+        for line, (ingredient, qty) in enumerate(ingredients, start=1):
+            block[line][7:10] = [str(qty), str(qty), ingredient]
+        rows.extend(block)
+    return pd.DataFrame(rows)
+
+def _totals(table):
+    return dict(zip(table["INTERNAL NAME"], table["TOTAL QTY"]))
+
+def test_sub_recipes_are_exploded_across_stations():
+    explosion = BOMExplosion({
+        "Hot Kitchen": RecipeIndex(_sheet({"Pasta": (4, [("Sauce", 1), ("Noodles", 2)])})),
+        "Cold Kitchen": RecipeIndex(_sheet({"Sauce": (2, [("Tomato", 1), ("Salt", 0.1), ("Base", 1)]),
+                                            "Base": (5, [("Stock", 10)])}))
+    })
+    # One batch of Sauce makes 2, so 1 Sauce is half a batch of Sauce and a tenth of a batch of Base
+    assert _totals(explosion.explode("Pasta", 3)) == pytest.approx({"Noodles": 6, "Tomato": 1.5, "Salt": 0.15, "Stock": 3})
+    assert _totals(explosion.explode("pasta ", 1)) == _totals(explosion.explode("Pasta"))
+    assert explosion.explode("Unknown").empty
+
+def test_plan_explosion_matches_single_explosions():
+    explosion = BOMExplosion({"Hot Kitchen": RecipeIndex(_sheet({
+        "Base": (5, [("Stock", 10)]),
+        "Soup": (10, [("Base", 2), ("Leek", 3)]),
+        "Stew": (8, [("Base", 5), ("Soup", 4), ("Beef", 2)])
+    }))})
+    plan = pd.DataFrame({"RECIPE": ["Soup", "Stew", "Nope", "Soup"], "BATCHES": [2, 3, 1, 1]})
+    pick_list, unknown = explosion.explode_plan(plan)
+
+    expected = {}
+    for recipe, batches in [("Soup", 3), ("Stew", 3)]:
+        for name, qty in _totals(explosion.explode(recipe, batches)).items():
+            expected[name] = expected.get(name, 0) + qty
+    assert _totals(pick_list) == pytest.approx(expected, abs=0.002)
+    assert unknown == ["Nope"]
+
+def test_cycles_are_reported_with_their_path():
+    explosion = BOMExplosion({"Hot Kitchen": RecipeIndex(_sheet({
+        "Gravy": (2, [("Roux", 1), ("Stock", 1)]),
+        "Roux": (2, [("Gravy", 1), ("Flour", 1)]),
+        "Bread": (4, [("Flour", 2)])
+    }))})
+    with pytest.raises(BOMCycleError, match="Gravy -> Roux -> Gravy"):
+        explosion.explode("Gravy")
+
+    # The batch matrix leaves the cycle out but keeps every other recipe
+    matrix = explosion.batch_matrix()
+    assert set(explosion.cycle_errors) == {"GRAVY", "ROUX"}
+    assert "Roux -> Gravy -> Roux" in explosion.cycle_errors["ROUX"]
+    assert _totals(explosion.explode_plan(pd.DataFrame({"RECIPE": ["Bread"], "BATCHES": [2]}))[0]) == {"Flour": 4}
+    with pytest.raises(BOMCycleError):
+        explosion.explode_plan(pd.DataFrame({"RECIPE": ["Bread", "Roux"], "BATCHES": [1, 1]}))
+    assert len(matrix["recipes"]) == 3
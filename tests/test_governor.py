@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from bom.governor import BACKGROUND, INTERACTIVE, SheetsGovernor, TokenBucket, request_priority
+from bom.metrics import METRICS
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def _deduplicated():
+    return sum(row["value"] for row in METRICS.counters() if row["counter"] == "sheets_deduplicated_total")
+
+def test_interactive_requests_are_served_before_queued_background_ones():
+    bucket = TokenBucket("read", per_minute=120, burst=1)
+    bucket.acquire()
+    order = []
+
+    def take(name, priority):
+        bucket.acquire(priority)
+        order.append(name)
+
+    threads = []
+    for name, priority in [("background 1", BACKGROUND), ("background 2", BACKGROUND), ("interactive", INTERACTIVE)]:
+        threads.append(threading.Thread(target=take, args=(name, priority)))
+        threads[-1].start()
+        _wait_until(lambda: len(bucket._waiters) == len(threads))
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "background 1", "background 2"]
+
+def test_identical_reads_in_flight_share_one_error():
+    governor = SheetsGovernor()
+    release = threading.Event()
+    calls = []
+
+    def failing_read():
+        calls.append(1)
+        release.wait(5)
+        raise ConnectionError("connection reset")
+
+    errors = []
+
+    def read():
+        try:
+            governor.call(failing_read, None, key="values")
+        except ConnectionError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=read)
+    leader.start()
+    _wait_until(lambda: "values" in governor._flights)
+    deduplicated = _deduplicated()
+    follower = threading.Thread(target=read)
+    follower.start()
+    _wait_until(lambda: _deduplicated() > deduplicated)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # The failed flight is over: the next read is issued again
+    with pytest.raises(ConnectionError):
+        governor.call(failing_read, None, key="values")
+    assert len(calls) == 2
+
+def test_interactive_read_promotes_the_background_read_it_joins():
+    governor = SheetsGovernor(reads_per_minute=120, burst=1)
+    bucket = governor.buckets["read"]
+    bucket.acquire()
+    order = []
+
+    def read(name, priority, key):
+        with request_priority(priority):
+            governor.call(lambda: order.append(name), "read", key=key)
+
+    threads = [threading.Thread(target=read, args=("other background", BACKGROUND, "other")),
+               threading.Thread(target=read, args=("shared", BACKGROUND, "shared"))]
+    for thread in threads:
+        thread.start()
+        _wait_until(lambda: len(bucket._waiters) == threads.index(thread) + 1)
+    joiner = threading.Thread(target=read, args=("joiner", INTERACTIVE, "shared"))
+    joiner.start()
+    _wait_until(lambda: "shared" not in governor._flights or governor._flights["shared"].waiter.priority == INTERACTIVE)
+    for thread in threads + [joiner]:
+        thread.join(5)
+    # The joiner shared the shared read's result instead of calling its own
+    assert order == ["shared", "other background"]
@@ -0,0 +1,76 @@
+import csv
+import os
+import time
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import bom
+from bom.synthetic import generate_station_data
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bomexplosion.py")
+
+def _pack_row(path, recipe, size):
+    """Row number of a recipe's pack size in a station CSV"""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    in_recipe = False
+    for i, row in enumerate(rows):
+        if row[0] == "INTERNAL NAME":
+            in_recipe = row[1] == recipe
+        elif in_recipe and row[2] == size and row[1] in ("TRUE", "FALSE"):
+            return rows, i
+    raise AssertionError(f"{size} of {recipe} not found")
+
+def _read_flag(path, recipe, size):
+    rows, i = _pack_row(path, recipe, size)
+    return rows[i][1]
+
+def _write_flag(path, recipe, size, flag):
+    rows, i = _pack_row(path, recipe, size)
+    rows[i][1] = flag
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+@pytest.fixture
+def csv_site(tmp_path, monkeypatch):
+    for station, df in generate_station_data(bom.STATIONS, num_recipes=3, num_ingredients=3).items():
+        df.to_csv(tmp_path / f"{station}.csv", header=False, index=False)
+    monkeypatch.setattr(bom, "load_sites", lambda: [bom.Site("Main", f"csv:{tmp_path}")])
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield tmp_path
+    st.cache_resource.clear()
+
+def test_external_pack_size_change_is_not_reverted(csv_site):
+    at = AppTest.from_file(APP, default_timeout=30).run()
+    recipe = at.selectbox(key="subrecipe_selector").value
+    box = next(c for c in at.checkbox if c.key and c.key.startswith(f"pack_{recipe}_"))
+    size = box.label
+    path = csv_site / f"{bom.STATIONS[0]}.csv"
+    assert _read_flag(path, recipe, size) == ("TRUE" if box.value else "FALSE")
+
+    # Someone else flips the flag; this session picks up the new sheet data
+    external = "FALSE" if box.value else "TRUE"
+    _write_flag(path, recipe, size, external)
+    st.cache_resource.clear()
+
+    # An unrelated edit must not write the session's stale checkbox value back
+    at.number_input(key="batches_input").set_value(3).run()
+    time.sleep(1.5)
+    assert not at.exception
+    assert _read_flag(path, recipe, size) == external
+    assert next(c for c in at.checkbox if c.key == box.key).value == (external == "TRUE")
+
+def test_toggle_writes_pack_size(csv_site):
+    at = AppTest.from_file(APP, default_timeout=30).run()
+    recipe = at.selectbox(key="subrecipe_selector").value
+    box = next(c for c in at.checkbox if c.key and c.key.startswith(f"pack_{recipe}_"))
+    path = csv_site / f"{bom.STATIONS[0]}.csv"
+
+    box.set_value(not box.value).run()
+    deadline = time.time() + 10
+    while _read_flag(path, recipe, box.label) != ("FALSE" if box.value else "TRUE") and time.time() < deadline:
+        time.sleep(0.1)
+    assert _read_flag(path, recipe, box.label) == ("FALSE" if box.value else "TRUE")
@@ -0,0 +1,138 @@
+import math
+
+import pandas as pd
+import pytest
+
+from bom.parsing import RecipeIndex, StationData, _to_number, find_pack_size_rows
+from bom.synthetic import generate_station_sheet
+
+def _baseline_extract_bom_data(df, start_row):
+    """extract_bom_data as the app shipped it before the vectorized parser, kept as the reference"""
+    section = df.iloc[start_row:start_row+24]
+    internal_name = str(section.iloc[0, 1]) if pd.notna(section.iloc[0, 1]) else ""
+    sku_code = str(section.iloc[1, 1]) if pd.notna(section.iloc[1, 1]) else ""
+    specs_data = []
+    pack_sizes = []
+    final_net_output = ""
+    for idx, row in section.iterrows():
+        col_a = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
+        col_b = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
+        col_c = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ""
+        if col_a in ["Standard Batch Size"]:
+            specs_data.append({"SPECIFICATIONS": col_a, "Value": col_b, "UOM": col_c})
+        elif col_a == "Final Net Output (yielded weight)":
+            final_net_output = col_b
+        elif col_a == "Pack Size" or (col_a == "" and col_b in ["TRUE", "FALSE"] and col_c in ["500g", "1000g", "2000g", "5000g"]):
+            if col_b in ["TRUE", "FALSE"] and col_c:
+                pack_sizes.append({"size": col_c, "available": col_b == "TRUE"})
+    recipe_yield = ""
+    recipe_batches = ""
+    for idx, row in section.iterrows():
+        if len(row) > 6:
+            col_f = str(row.iloc[5]).strip() if pd.notna(row.iloc[5]) else ""
+            col_g = str(row.iloc[6]).strip() if pd.notna(row.iloc[6]) else ""
+            if col_f and col_g and col_f != "RECIPE YIELD (Unportioned)":
+                try:
+                    float(col_f)
+                    recipe_yield = col_f
+                    recipe_batches = col_g
+                    break
+                except ValueError:
+                    pass
+    ingredients_data = []
+    for idx, row in section.iterrows():
+        if len(row) > 9:
+            qty = str(row.iloc[7]).strip() if pd.notna(row.iloc[7]) else ""
+            batch_qty = str(row.iloc[8]).strip() if pd.notna(row.iloc[8]) else ""
+            ingredient_name = str(row.iloc[9]).strip() if pd.notna(row.iloc[9]) else ""
+            if qty and batch_qty and ingredient_name and ingredient_name != "INTERNAL NAME":
+                try:
+                    float(qty)
+                    ingredients_data.append({"QTY": qty, "BATCH QTY": batch_qty, "INTERNAL NAME": ingredient_name})
+                except ValueError:
+                    pass
+    labor_data = []
+    labor_departments = ["Dry Product Scaling", "Vegetable Production", "Butchery",
+                         "Cold Kitchen", "Hot Kitchen", "Pastry Kitchen", "Packaging", "TOTAL"]
+    for idx, row in section.iterrows():
+        col_a = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else ""
+        if col_a in labor_departments:
+            notes = str(row.iloc[1]).strip() if pd.notna(row.iloc[1]) else ""
+            batch_production = str(row.iloc[2]).strip() if pd.notna(row.iloc[2]) else ""
+            cost = str(row.iloc[3]).strip() if pd.notna(row.iloc[3]) else ""
+            labor_data.append({"LABOR PRODUCTIVITY (minutes)": col_a, "Procedure Notes": notes,
+                               "Batch Production": batch_production, "Cost per 1 batch": cost})
+    return {
+        "internal_name": internal_name, "sku_code": sku_code, "base_specs": specs_data,
+        "recipe_yield": recipe_yield, "recipe_batches": recipe_batches, "final_net_output": final_net_output,
+        "ingredients": pd.DataFrame(ingredients_data), "labor_productivity": pd.DataFrame(labor_data),
+        "pack_sizes": pack_sizes
+    }
+
+def _number(value):
+    """A baseline text cell as the number the app computed with: float(), else missing"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _missing(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+def _junk_sheet():
+    # 11 ingredients make every synthetic recipe exactly the 24 rows the baseline reads
+    df = generate_station_sheet(num_recipes=6, num_ingredients=11, subrecipe_ratio=0.3)
+    df.iat[3, 8] = "1:30"            # BATCH QTY
+    df.iat[4, 8] = "2 x 500g"
+    df.iat[5, 7] = "1/2"             # QTY: not an ingredient line
+    df.iat[27, 6] = "2-3"            # RECIPE (# of Batches)
+    df.iat[29, 1] = "12 (approx 15)" # Final Net Output
+    df.iat[41, 3] = "n/a"            # labor cost
+    df.iat[42, 2] = "1:30"           # labor batch production
+    df.iat[51, 5] = "abc"            # RECIPE YIELD: no yield for this recipe
+    return df
+
+@pytest.mark.parametrize("df", [generate_station_sheet(num_recipes=6, num_ingredients=11), _junk_sheet()])
+def test_parser_matches_baseline_extract_bom_data(df):
+    index = RecipeIndex(df)
+    assert len(index.names) == 6
+    for name, (start_row, _) in index.bounds.items():
+        expected = _baseline_extract_bom_data(df, start_row)
+        bom = index.boms[name]
+
+        assert (bom['internal_name'], bom['sku_code']) == (expected['internal_name'], expected['sku_code'])
+        assert list(bom['base_specs']) == [tuple(spec.values()) for spec in expected['base_specs']]
+        for field in ("recipe_yield", "recipe_batches", "final_net_output"):
+            assert _missing(bom[field]) == _number(expected[field]), field
+        assert [(pack.size, pack.available) for pack in bom['pack_sizes']] == \
+            [(pack["size"], pack["available"]) for pack in expected['pack_sizes']]
+        assert [(row[2], row[0], _missing(row[1])) for row in bom['ingredients'].itertuples(index=False)] == \
+            [(row[2], _number(row[0]), _number(row[1])) for row in expected['ingredients'].itertuples(index=False)]
+        assert [(row[0], row[1], _missing(row[2]), _missing(row[3]))
+                for row in bom['labor_productivity'].itertuples(index=False)] == \
+            [(row[0], row[1], _number(row[2]), _number(row[3]))
+             for row in expected['labor_productivity'].itertuples(index=False)]
+
+def test_to_number_reads_formatted_single_numbers():
+    values = pd.Series(["12.5", "1,250.50", "₱320.00", " $ 1,000 ", "-3", ".5"])
+    assert _to_number(values).tolist() == [12.5, 1250.5, 320.0, 1000.0, -3.0, 0.5]
+
+def test_to_number_leaves_junk_as_nan():
+    values = pd.Series(["1:30", "2 x 500g", "12 (approx 15)", "1/2", "", "abc", "1-2"])
+    assert all(math.isnan(number) for number in _to_number(values))
+
+def test_patched_station_data_matches_the_edited_sheet():
+    df = generate_station_sheet(num_recipes=20)
+    data = StationData.from_frame(df)
+    recipe = data.index.names[3]
+    pack_rows = data.pack_rows(recipe)
+    assert pack_rows == find_pack_size_rows(df, *data.index.bounds[recipe])
+
+    size, row = next(iter(pack_rows.items()))
+    available = df.at[row, 1] != "TRUE"
+    edited = df.copy()
+    edited.at[row, 1] = "TRUE" if available else "FALSE"
+    patched = data.with_pack_sizes({row: available})
+
+    assert patched.index.boms[recipe]['pack_sizes'] == StationData.from_frame(edited).index.boms[recipe]['pack_sizes']
+    assert patched.index.boms[recipe]['pack_sizes'] != data.index.boms[recipe]['pack_sizes']
@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+import requests
+from gspread.exceptions import APIError
+
+from bom import sheets
+from bom.parsing import StationData
+from bom.sheets import PackSizeRowError, SheetsSession, SnapshotStore, StationDataCache, fetch_stations_data
+from bom.synthetic import generate_station_sheet
+
+class _Response:
+    status_code = 400
+    text = "Unable to parse range"
+
+    def json(self):
+        return {"error": {"code": 400, "message": self.text, "status": "INVALID_ARGUMENT"}}
+
+class _Worksheet:
+    def __init__(self, title):
+        self.title = title
+
+class _Spreadsheet:
+    def __init__(self, titles):
+        self.titles = titles
+        self.batch_gets = 0
+
+    def worksheets(self):
+        return [_Worksheet(title) for title in self.titles]
+
+    def values_batch_get(self, ranges):
+        self.batch_gets += 1
+        if any(r.strip("'").split("'!")[0] not in self.titles for r in ranges):
+            raise APIError(_Response())
+        return {"valueRanges": [{"values": [[r]]} for r in ranges]}
+
+def _session(spreadsheet, station_sheets):
+    session = SheetsSession.__new__(SheetsSession)
+    session.spreadsheet = spreadsheet
+    session.station_sheets = station_sheets
+    session._worksheets = {}
+    session._lock = threading.Lock()
+    return session
+
+def test_renamed_worksheet_is_reopened():
+    spreadsheet = _Spreadsheet(["Cover", "Butchery"])
+    session = _session(spreadsheet, {"Butchery": 1})
+    session.batch_get_values(["Butchery"])
+
+    spreadsheet.titles = ["Cover", "Butchery (old)"]
+    values = session.batch_get_values(["Butchery"])
+    assert "Butchery (old)" in values["Butchery"][0][0]
+    assert spreadsheet.batch_gets == 3
+
+def test_missing_worksheet_falls_back_to_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    store.save("key", 7, [["cached"]], "t0")
+    session = _session(_Spreadsheet(["Cover"]), {"Butchery": 7})
+    session.modified_time = lambda: "t1"
+
+    data = fetch_stations_data(session, store, ["Butchery"], "key", {"Butchery": 7})
+    assert data["Butchery"].iat[0, 0] == "cached"
+
+class _FailingSession:
+    def modified_time(self):
+        return "t1"
+
+    def batch_get_values(self, stations):
+        raise requests.exceptions.ConnectionError("connection reset")
+
+def test_fallback_is_per_station(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    store.save("key", 2, [["butchery"]], "t0")
+    stations = {"Butchery": 2, "Pastry": 5}
+
+    data = fetch_stations_data(_FailingSession(), store, list(stations), "key", stations)
+    assert data["Butchery"].iat[0, 0] == "butchery"
+    assert data["Pastry"] is None
+
+def test_unchanged_snapshot_is_not_parsed_again(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    store.save("key", 2, generate_station_sheet(num_recipes=3).values.tolist(), "t0")
+    stations = {"Butchery": 2}
+
+    first = StationData.from_frame(fetch_stations_data(None, store, ["Butchery"], "key", stations)["Butchery"])
+    again = fetch_stations_data(None, store, ["Butchery"], "key", stations)["Butchery"]
+    assert StationData.from_frame(again, first) is first
+
+    store.save("key", 2, generate_station_sheet(num_recipes=3, seed=1).values.tolist(), "t1")
+    changed = fetch_stations_data(None, store, ["Butchery"], "key", stations)["Butchery"]
+    assert StationData.from_frame(changed, first).content_hash != first.content_hash
+
+class _StaticSession:
+    def __init__(self, values):
+        self.values = values
+        self.batch_gets = 0
+
+    def modified_time(self):
+        return "t0"
+
+    def batch_get_values(self, stations):
+        self.batch_gets += 1
+        return {station: self.values for station in stations}
+
+def test_written_worksheet_is_downloaded_until_settled(tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    store.save("key", 2, [["before"]], "t0")
+    session = _StaticSession([["after"]])
+    stations = {"Butchery": 2}
+    assert fetch_stations_data(session, store, ["Butchery"], "key", stations)["Butchery"].iat[0, 0] == "before"
+
+    # Drive still reports the modifiedTime from before the write
+    store.mark_written("key", 2)
+    assert SnapshotStore(store.path).load("key", 2)["modified_time"] is None
+    monkeypatch.setattr(sheets, "WRITE_SETTLE_SECONDS", 3600)
+    assert fetch_stations_data(session, store, ["Butchery"], "key", stations)["Butchery"].iat[0, 0] == "after"
+    fetch_stations_data(session, store, ["Butchery"], "key", stations)
+    assert session.batch_gets == 2
+
+    monkeypatch.setattr(sheets, "WRITE_SETTLE_SECONDS", 0)
+    fetch_stations_data(session, store, ["Butchery"], "key", stations)
+    assert session.batch_gets == 2
+
+def test_refresh_right_after_a_write_keeps_the_patch():
+    df = generate_station_sheet(num_recipes=3)
+    cache = StationDataCache(lambda stations: {station: df for station in stations}, ["Butchery"], write_settle=3600)
+    original = cache.get("Butchery")
+    recipe = original.index.names[0]
+    row = next(iter(original.pack_rows(recipe).values()))
+
+    cache.patch("Butchery", {row: df.at[row, 1] != "TRUE"})
+    patched = cache.get("Butchery")
+    # The refresh reads the sheet as it was before the write landed
+    cache.refresh(["Butchery"])
+    assert cache.get("Butchery") is patched
+
+    cache.write_settle = 0
+    cache.refresh(["Butchery"])
+    assert cache.get("Butchery").content_hash == original.content_hash
+
+class _WritableWorksheet(_Worksheet):
+    def __init__(self, title, column_c):
+        super().__init__(title)
+        self.column_c = column_c
+        self.updates = []
+
+    def batch_update(self, data, value_input_option=None):
+        self.updates.extend(data)
+
+class _WritableSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def worksheets(self):
+        return [self.worksheet]
+
+    def values_batch_get(self, ranges):
+        rows = [int(r.split("!B")[1].split(":")[0]) for r in ranges]
+        return {"valueRanges": [{"values": [["FALSE", self.worksheet.column_c.get(row, "")]]} for row in rows]}
+
+def test_pack_size_write_skips_rows_that_moved():
+    # 1-based sheet rows: 500g moved down a row since the data was loaded, 1000g is still in place
+    worksheet = _WritableWorksheet("Butchery", {11: "Final Net Output", 12: "500g", 13: "1000g"})
+    session = _session(_WritableSpreadsheet(worksheet), {"Butchery": 0})
+
+    with pytest.raises(PackSizeRowError, match="500g"):
+        session.write_pack_sizes("Butchery", {"500g": 10, "1000g": 12}, {"500g": True, "1000g": True})
+    assert worksheet.updates == [{"range": "B13", "values": [["TRUE"]]}]
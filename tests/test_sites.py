@@ -0,0 +1,64 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from bom.explosion import BOMExplosion
+from bom.parsing import RecipeIndex
+from bom.sheets import SheetsSession, SnapshotStore
+from bom.sites import Site, consolidated_ingredient_totals
+from bom.synthetic import generate_station_sheet
+
+class _Worksheet:
+    def __init__(self, title):
+        self.title = title
+
+class _Spreadsheet:
+    def __init__(self, titles):
+        self.titles = titles
+
+    def worksheets(self):
+        return [_Worksheet(title) for title in self.titles]
+
+def _session(titles, station_sheets):
+    session = SheetsSession.__new__(SheetsSession)
+    session.spreadsheet = _Spreadsheet(titles)
+    session.station_sheets = station_sheets
+    session._worksheets = {}
+    session._lock = threading.Lock()
+    return session
+
+def test_unmapped_stations_read_their_own_worksheet():
+    site = Site("North", "sheets", "key", ["Butchery", "Bakery", "Commissary Prep"])
+    assert site.stations == {"Butchery": 2, "Bakery": "Bakery", "Commissary Prep": "Commissary Prep"}
+
+    session = _session(["Cover", "Notes", "Butchery", "Bakery", "Commissary Prep"], site.stations)
+    assert session.worksheet("Butchery").title == "Butchery"
+    assert session.worksheet("Bakery").title == "Bakery"
+    assert session.worksheet("Commissary Prep").title == "Commissary Prep"
+
+def test_missing_worksheet_is_a_clear_error():
+    session = _session(["Cover"], {"Bakery": "Bakery"})
+    with pytest.raises(KeyError, match="Bakery"):
+        session.worksheet("Bakery")
+
+def test_unmapped_stations_keep_separate_snapshots(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.sqlite3"))
+    stations = Site("North", "sheets", "key", ["Bakery", "Commissary Prep"]).stations
+    store.save("key", stations["Bakery"], [["bakery"]], "t1")
+    store.save("key", stations["Commissary Prep"], [["prep"]], "t1")
+    assert store.load("key", stations["Bakery"])["values"] == [["bakery"]]
+    assert store.load("key", stations["Commissary Prep"])["values"] == [["prep"]]
+
+def test_ingredient_totals_are_exploded_to_raw_materials():
+    indexes = {"Hot Kitchen": RecipeIndex(generate_station_sheet(num_recipes=20, subrecipe_ratio=0.5, station="Hot Kitchen"))}
+    index = indexes["Hot Kitchen"]
+    totals = consolidated_ingredient_totals({"Main": indexes}).set_index("INTERNAL NAME")["Main"]
+    assert not set(totals.index) & set(index.names)
+
+    explosion = BOMExplosion(indexes)
+    expected = pd.concat([
+        explosion.explode(name, index.boms[name]['recipe_batches'] or 0).set_index("INTERNAL NAME")["TOTAL QTY"]
+        for name in index.names
+    ]).groupby(level=0).sum()
+    assert totals.sort_index().tolist() == pytest.approx(expected[expected != 0].sort_index().tolist(), abs=0.01)
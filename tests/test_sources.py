@@ -0,0 +1,114 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from bom.parsing import find_pack_size_rows
+from bom.sheets import PackSizeRowError
+from bom.sources import CsvSource, XlsxSource
+from bom.synthetic import generate_station_sheet
+
+def _workbook(path, df):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = "Butchery"
+    for row in df.fillna("").itertuples(index=False):
+        worksheet.append(list(row))
+    workbook.save(path)
+
+def test_xlsx_pack_size_write_leaves_workbook_untouched(tmp_path):
+    path = tmp_path / "bom.xlsx"
+    _workbook(path, generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery"))
+    original = path.read_bytes()
+    source = XlsxSource(str(path))
+
+    df = source.fetch(["Butchery"])["Butchery"]
+    pack_rows = find_pack_size_rows(df, 2, len(df))
+    size, row = next(iter(pack_rows.items()))
+    flag = df.iat[row, 1] != "TRUE"
+    source.write_pack_sizes("Butchery", pack_rows, {size: flag})
+
+    assert path.read_bytes() == original
+    reloaded = source.fetch(["Butchery"])["Butchery"]
+    assert reloaded.iat[row, 1] == ("TRUE" if flag else "FALSE")
+    assert reloaded.drop(columns=1).equals(df.drop(columns=1))
+
+def test_csv_pack_size_write_checks_the_row_still_holds_the_size(tmp_path):
+    generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery").to_csv(
+        tmp_path / "Butchery.csv", header=False, index=False)
+    source = CsvSource(str(tmp_path))
+    df = source.fetch(["Butchery"])["Butchery"]
+    pack_rows = find_pack_size_rows(df, 2, len(df))
+    size = next(iter(pack_rows))
+
+    # Someone inserts a row above the recipe after it was loaded
+    with open(tmp_path / "Butchery.csv", encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(tmp_path / "Butchery.csv", "w", encoding="utf-8") as f:
+        f.writelines(lines[:2] + ["inserted\n"] + lines[2:])
+    before = source.fetch(["Butchery"])["Butchery"]
+
+    with pytest.raises(PackSizeRowError, match=size):
+        source.write_pack_sizes("Butchery", pack_rows, {size: True})
+    assert source.fetch(["Butchery"])["Butchery"].equals(before)
+
+def test_csv_pack_size_write_updates_rows_in_place(tmp_path):
+    generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery").to_csv(
+        tmp_path / "Butchery.csv", header=False, index=False)
+    source = CsvSource(str(tmp_path))
+    df = source.fetch(["Butchery"])["Butchery"]
+    pack_rows = find_pack_size_rows(df, 2, len(df))
+    changes = {size: df.iat[row, 1] != "TRUE" for size, row in pack_rows.items()}
+
+    source.write_pack_sizes("Butchery", pack_rows, changes)
+    reloaded = source.fetch(["Butchery"])["Butchery"]
+    for size, row in pack_rows.items():
+        assert reloaded.iat[row, 1] == ("TRUE" if changes[size] else "FALSE")
+
+def test_xlsx_pack_size_write_checks_the_row_still_holds_the_size(tmp_path):
+    path = tmp_path / "bom.xlsx"
+    sheet = generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery")
+    _workbook(path, sheet)
+    source = XlsxSource(str(path))
+    df = source.fetch(["Butchery"])["Butchery"]
+    pack_rows = find_pack_size_rows(df, 2, len(df))
+    size = next(iter(pack_rows))
+
+    _workbook(path, pd.concat([sheet.iloc[:2], pd.DataFrame([["inserted"]]), sheet.iloc[2:]], ignore_index=True))
+    with pytest.raises(PackSizeRowError, match=size):
+        source.write_pack_sizes("Butchery", pack_rows, {size: True})
+
+def test_xlsx_pack_sizes_are_dropped_when_the_workbook_changes(tmp_path):
+    path = tmp_path / "bom.xlsx"
+    sheet = generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery")
+    _workbook(path, sheet)
+    source = XlsxSource(str(path))
+    df = source.fetch(["Butchery"])["Butchery"]
+    pack_rows = find_pack_size_rows(df, 2, len(df))
+    source.write_pack_sizes("Butchery", pack_rows, {size: df.iat[row, 1] != "TRUE" for size, row in pack_rows.items()})
+
+    # Re-exported with a row inserted above every recipe
+    _workbook(path, pd.concat([sheet.iloc[:2], pd.DataFrame([["inserted"]]), sheet.iloc[2:]], ignore_index=True))
+    os.utime(path, (os.path.getmtime(path) + 1,) * 2)
+    reloaded = source.fetch(["Butchery"])["Butchery"]
+    assert reloaded.iloc[3:, 1].tolist() == df.iloc[2:, 1].tolist()
+    assert not os.path.exists(source.overrides_path)
+
+def test_xlsx_pack_size_is_only_applied_to_a_row_holding_the_size(tmp_path):
+    path = tmp_path / "bom.xlsx"
+    _workbook(path, generate_station_sheet(num_recipes=2, num_ingredients=2, station="Butchery"))
+    source = XlsxSource(str(path))
+    df = source.fetch(["Butchery"])["Butchery"]
+    size, row = next(iter(find_pack_size_rows(df, 2, len(df)).items()))
+    source.write_pack_sizes("Butchery", {size: row}, {size: df.iat[row, 1] != "TRUE"})
+
+    with open(source.overrides_path, encoding="utf-8") as f:
+        sidecar = json.load(f)
+    sidecar["stations"]["Butchery"][str(row - 1)] = {"size": "other", "flag": "TRUE"}
+    with open(source.overrides_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f)
+    reloaded = source.fetch(["Butchery"])["Butchery"]
+    assert reloaded.iat[row, 1] != df.iat[row, 1]
+    assert reloaded.iat[row - 1, 1] == df.iat[row - 1, 1]
@@ -0,0 +1,44 @@
+import threading
+
+import requests
+
+from bom.writes import PackSizeWriteQueue, is_retryable
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class _ApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = _Response(status_code)
+
+def test_transport_errors_are_retryable():
+    assert is_retryable(requests.exceptions.ConnectionError("connection reset"))
+    assert is_retryable(requests.exceptions.ReadTimeout("read timed out"))
+    assert is_retryable(requests.exceptions.ConnectTimeout("connect timed out"))
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(TimeoutError())
+
+def test_status_codes():
+    assert is_retryable(_ApiError(429))
+    assert is_retryable(_ApiError(503))
+    assert not is_retryable(_ApiError(400))
+    assert not is_retryable(ValueError("bad range"))
+
+def test_dropped_connection_is_retried():
+    calls = []
+
+    def write(station, pack_rows, changes):
+        calls.append(changes)
+        if len(calls) == 1:
+            raise requests.exceptions.ConnectionError("connection aborted")
+
+    written = threading.Event()
+    queue = PackSizeWriteQueue(write, on_written=lambda *args: written.set(), delay=0, backoff=0)
+    ticket = queue.submit("Butchery", "Recipe", {"500g": 10}, {"500g": True})
+    assert queue.wait(5)
+    assert written.is_set()
+    assert queue.status(ticket)["state"] == "done"
+    assert queue.status(ticket)["attempts"] == 2
+    assert len(calls) == 2